@@ -0,0 +1,406 @@
+#!/usr/bin/env python
+"""
+benchmark.py -- measures ConferenceApi endpoints against local App Engine
+    service stubs (datastore, memcache, taskqueue) from the SDK's testbed.
+
+The stubs are seeded through the API itself, so every entity the endpoints
+maintain on writes (seat shards, speaker counters, ...) is in place. Each
+endpoint is then called repeatedly and the latency percentiles, datastore
+RPCs and entities read per call are reported, giving a baseline to compare
+against before each deploy.
+
+Usage:
+    python benchmark.py --sdk ~/google-cloud-sdk/platform/google_appengine \\
+        --conferences 200 --sessions 2000 --speakers 100 --profiles 50
+
+Author: Zeeshan Ahmad
+Email: ahmad.zeeshaan@gmail.com
+
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+__author__ = 'ahmad.zeeshan@gmail.com (Zeeshan Ahmad)'
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+SESSION_TYPES = ['Workshop', 'Lecture', 'Keynote', 'Panel']
+CITIES = ['London', 'Paris', 'Berlin', 'Tokyo', 'San Francisco', 'Chicago']
+TOPICS = ['Medical Innovations', 'Programming Languages', 'Web Technologies',
+          'Movie Making', 'Health and Nutrition']
+
+
+def setup_sdk(sdk_path):
+    """Put the App Engine SDK and its bundled libraries on sys.path."""
+    if sdk_path:
+        sys.path.insert(0, sdk_path)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+    sys.path.insert(0, APP_ROOT)
+
+
+class RpcCounter(object):
+    """Counts API calls, per service and method, made through the stubs,
+    along with the number of datastore entities they read and wrote."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.calls = {}
+        self.entities_read = 0
+        self.entities_written = 0
+
+    def __call__(self, service, call, request, response):
+        name = '%s.%s' % (service, call)
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if service != 'datastore_v3':
+            return
+        if call == 'Get':
+            self.entities_read += response.entity_size()
+        elif call in ('RunQuery', 'Next'):
+            self.entities_read += response.result_size()
+        elif call == 'Put':
+            self.entities_written += request.entity_size()
+
+    def count(self, service, calls=None):
+        """Number of calls to a service, optionally only the given methods."""
+        return sum(n for name, n in self.calls.items()
+                   if name.split('.')[0] == service and
+                   (calls is None or name.split('.')[1] in calls))
+
+
+class Benchmark(object):
+    """Seeds the stubs and times ConferenceApi endpoints."""
+
+    def __init__(self, options):
+        from google.appengine.api import apiproxy_stub_map
+        from google.appengine.datastore import datastore_stub_util
+        from google.appengine.ext import testbed
+
+        self.options = options
+        self.random = random.Random(options.seed)
+
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.setup_env(app_id='conference-benchmark',
+                               overwrite=True)
+        policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+            probability=1)
+        self.testbed.init_datastore_v3_stub(consistency_policy=policy)
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub(root_path=APP_ROOT)
+        self.testbed.init_app_identity_stub()
+        self.testbed.init_mail_stub()
+        self.testbed.init_urlfetch_stub()
+        self.testbed.init_user_stub()
+
+        self.rpcs = RpcCounter()
+        apiproxy_stub_map.apiproxy.GetPostCallHooks().Append(
+            'benchmark-rpc-counter', self.rpcs)
+
+        from conference import ConferenceApi
+        self.api = ConferenceApi()
+
+        self.emails = []
+        self.conferences = []
+        self.speakers = []
+        self.sessions = []
+
+    def close(self):
+        self.testbed.deactivate()
+
+    def login(self, email):
+        """Make endpoints.get_current_user() return the given user."""
+        os.environ['ENDPOINTS_AUTH_EMAIL'] = email
+        os.environ['ENDPOINTS_AUTH_DOMAIN'] = 'gmail.com'
+
+    # - - - Seeding - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def seed(self):
+        from models import ConferenceForm
+        from models import SessionForm
+        from models import SpeakerForm
+
+        options = self.options
+        rnd = self.random
+        self.emails = ['user%d@example.com' % i
+                       for i in range(options.profiles)]
+
+        for i in range(options.conferences):
+            email = self.emails[i % len(self.emails)]
+            self.login(email)
+            month = rnd.randint(1, 12)
+            form = self.api._createConferenceObject(ConferenceForm(
+                name='Conference %d' % i,
+                description='Benchmark conference %d' % i,
+                topics=rnd.sample(TOPICS, 2),
+                city=rnd.choice(CITIES),
+                startDate='2017-%02d-01' % month,
+                endDate='2017-%02d-03' % month,
+                maxAttendees=rnd.choice([10, 50, 100, 500, 1000])))
+            self.conferences.append((email, form))
+
+        self.login(self.emails[0])
+        for i in range(options.speakers):
+            form = self.api._createSpeakerObject(SpeakerForm(
+                name='Speaker %d' % i,
+                organization='Organization %d' % (i % 10),
+                interests=rnd.sample(TOPICS, 2)))
+            self.speakers.append(form.websafeSpeakerKey)
+
+        for i in range(options.sessions):
+            email, conf = rnd.choice(self.conferences)
+            self.login(email)
+            form = self.api._createSessionObject(SessionForm(
+                name='Session %d' % i,
+                highlights=rnd.sample(TOPICS, 1),
+                websafeSpeakerKey=rnd.choice(self.speakers),
+                duration=rnd.choice([30, 45, 60, 90]),
+                typeOfSession=rnd.choice(SESSION_TYPES),
+                date=conf.startDate,
+                startTime=rnd.choice(range(900, 1900, 100)),
+                websafeConferenceKey=conf.websafeKey))
+            self.sessions.append(form.websafeSessionKey)
+
+        for email in self.emails:
+            self.login(email)
+            for _, conf in rnd.sample(self.conferences,
+                                      min(options.registrations,
+                                          len(self.conferences))):
+                self.call(self.api.registerForConference,
+                          self.confRequest(conf.websafeKey))
+            for wssk in rnd.sample(self.sessions,
+                                   min(options.wishlist,
+                                       len(self.sessions))):
+                self.call(self.api.addSessionToWishlist,
+                          self.sessionRequest(wssk))
+
+    def call(self, method, request):
+        """Call an endpoint, ignoring the API errors it raises."""
+        import endpoints
+        try:
+            return method(request)
+        except endpoints.ServiceException:
+            return None
+
+    def confRequest(self, websafeConferenceKey):
+        from conference import CONF_GET_REQUEST
+        return CONF_GET_REQUEST.combined_message_class(
+            websafeConferenceKey=websafeConferenceKey)
+
+    def sessionRequest(self, websafeSessionKey):
+        from conference import SESSION_GET_REQUEST
+        return SESSION_GET_REQUEST.combined_message_class(
+            websafeSessionKey=websafeSessionKey)
+
+    # - - - Scenarios - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def scenarios(self):
+        """Return (name, function) pairs; each function makes one call."""
+        from protorpc import message_types
+        from models import ConferenceQueryForm
+        from models import ConferenceQueryForms
+        from models import ConferenceSessionQueryForm
+        from models import ConferenceSessionTypeStartTimeQueryForm
+        from models import SessionForm
+
+        api = self.api
+        rnd = self.random
+        void = message_types.VoidMessage()
+
+        def someConference():
+            return rnd.choice(self.conferences)[1].websafeKey
+
+        def asSomeone():
+            self.login(rnd.choice(self.emails))
+
+        def queryConferences():
+            api.queryConferences(ConferenceQueryForms())
+
+        def queryConferencesFiltered():
+            api.queryConferences(ConferenceQueryForms(filters=[
+                ConferenceQueryForm(field='MONTH', operator='GT', value='6'),
+                ConferenceQueryForm(field='MAX_ATTENDEES', operator='LT',
+                                    value='500')]))
+
+        def getConference():
+            from conference import CONF_ETAG_GET_REQUEST
+            api.getConference(CONF_ETAG_GET_REQUEST.combined_message_class(
+                websafeConferenceKey=someConference()))
+
+        def getConferenceSessions():
+            api.getConferenceSessions(ConferenceSessionQueryForm(
+                websafeConferenceKey=someConference()))
+
+        def querySessionByTypeAndStartTime():
+            api.querySessionByTypeAndStartTime(
+                ConferenceSessionTypeStartTimeQueryForm(
+                    typeOfSession='Workshop', startTime=1900))
+
+        def getSpeakerWithHighestNumberOfSessions():
+            api.getSpeakerWithHighestNumberOfSessions(
+                self.confRequest(None))
+
+        def registration():
+            asSomeone()
+            request = self.confRequest(someConference())
+            self.call(api.registerForConference, request)
+            self.call(api.unregisterFromConference, request)
+
+        def getConferencesToAttend():
+            asSomeone()
+            api.getConferencesToAttend(void)
+
+        def wishlist():
+            asSomeone()
+            request = self.sessionRequest(rnd.choice(self.sessions))
+            self.call(api.addSessionToWishlist, request)
+            self.call(api.deleteSessionInWishlist, request)
+
+        def getSessionsInWishlist():
+            asSomeone()
+            from conference import PAGE_GET_REQUEST
+            api.getSessionsInWishlist(
+                PAGE_GET_REQUEST.combined_message_class())
+
+        def createSession():
+            email, conf = rnd.choice(self.conferences)
+            self.login(email)
+            api.createSession(SessionForm(
+                name='Benchmark session',
+                websafeSpeakerKey=rnd.choice(self.speakers),
+                duration=60, typeOfSession='Lecture', date=conf.startDate,
+                startTime=1000, websafeConferenceKey=conf.websafeKey))
+
+        return [
+            ('queryConferences', queryConferences),
+            ('queryConferences (2 inequalities)', queryConferencesFiltered),
+            ('getConference', getConference),
+            ('getConferenceSessions', getConferenceSessions),
+            ('querySessionByTypeAndStartTime',
+             querySessionByTypeAndStartTime),
+            ('getSpeakerWithHighestNumberOfSessions',
+             getSpeakerWithHighestNumberOfSessions),
+            ('register + unregister', registration),
+            ('getConferencesToAttend', getConferencesToAttend),
+            ('add + delete wishlist session', wishlist),
+            ('getSessionsInWishlist', getSessionsInWishlist),
+            ('createSession', createSession),
+        ]
+
+    def run(self, name, function):
+        """Call a scenario options.iterations times; return its stats."""
+        from google.appengine.ext import ndb
+
+        latencies = []
+        datastore_rpcs = memcache_rpcs = task_rpcs = 0
+        entities_read = entities_written = 0
+        for _ in range(self.options.iterations):
+            # every request starts with an empty in-context cache
+            ndb.get_context().clear_cache()
+            self.rpcs.reset()
+            start = time.time()
+            function()
+            latencies.append((time.time() - start) * 1000)
+            datastore_rpcs += self.rpcs.count('datastore_v3')
+            memcache_rpcs += self.rpcs.count('memcache')
+            task_rpcs += self.rpcs.count('taskqueue')
+            entities_read += self.rpcs.entities_read
+            entities_written += self.rpcs.entities_written
+
+        calls = float(len(latencies))
+        latencies.sort()
+        return {
+            'endpoint': name,
+            'calls': len(latencies),
+            'p50_ms': percentile(latencies, 50),
+            'p90_ms': percentile(latencies, 90),
+            'p99_ms': percentile(latencies, 99),
+            'datastore_rpcs': datastore_rpcs / calls,
+            'entities_read': entities_read / calls,
+            'entities_written': entities_written / calls,
+            'memcache_rpcs': memcache_rpcs / calls,
+            'taskqueue_rpcs': task_rpcs / calls,
+        }
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    rank = int(math.ceil(pct / 100.0 * len(values))) - 1
+    return values[max(0, rank)]
+
+
+# (result key, column header) of the report table, after the endpoint name
+REPORT_COLUMNS = [
+    ('p50_ms', 'p50 ms'),
+    ('p90_ms', 'p90 ms'),
+    ('p99_ms', 'p99 ms'),
+    ('datastore_rpcs', 'ds rpcs'),
+    ('entities_read', 'ds read'),
+    ('entities_written', 'ds write'),
+    ('memcache_rpcs', 'mc rpcs'),
+    ('taskqueue_rpcs', 'tq rpcs'),
+]
+
+
+def print_report(results):
+    print('%-40s' % 'endpoint' +
+          ''.join('%10s' % header for _, header in REPORT_COLUMNS))
+    for result in results:
+        print('%-40s' % result['endpoint'] +
+              ''.join('%10.1f' % result[key] for key, _ in REPORT_COLUMNS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sdk', help='path to the App Engine SDK '
+                        '(the directory containing dev_appserver.py)')
+    parser.add_argument('--conferences', type=int, default=100)
+    parser.add_argument('--sessions', type=int, default=1000)
+    parser.add_argument('--speakers', type=int, default=50)
+    parser.add_argument('--profiles', type=int, default=20)
+    parser.add_argument('--registrations', type=int, default=3,
+                        help='conferences each profile registers for')
+    parser.add_argument('--wishlist', type=int, default=5,
+                        help='sessions each profile adds to its wishlist')
+    parser.add_argument('--iterations', type=int, default=50,
+                        help='calls per endpoint')
+    parser.add_argument('--only', action='append',
+                        help='only run endpoints whose name contains this')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true',
+                        help='print results as JSON')
+    options = parser.parse_args()
+
+    setup_sdk(options.sdk)
+    benchmark = Benchmark(options)
+    try:
+        start = time.time()
+        benchmark.seed()
+        sys.stderr.write('seeded in %.1fs\n' % (time.time() - start))
+
+        results = []
+        for name, function in benchmark.scenarios():
+            if options.only and not any(o in name for o in options.only):
+                continue
+            results.append(benchmark.run(name, function))
+    finally:
+        benchmark.close()
+
+    if options.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""
+benchmark_converters.py -- compares the precompiled entity to form copies of
+    converters.py with the field by field reflective copy they replaced.
+
+Entities are built in memory, no datastore is involved. Each copy is run
+over all of them --repeat times and the best time per entity is reported,
+after checking that both copies give the same forms.
+
+Usage:
+    python benchmark_converters.py \\
+        --sdk ~/google-cloud-sdk/platform/google_appengine --entities 1000
+
+Author: Zeeshan Ahmad
+Email: ahmad.zeeshaan@gmail.com
+
+"""
+
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+
+from benchmark import CITIES
+from benchmark import SESSION_TYPES
+from benchmark import TOPICS
+from benchmark import setup_sdk
+
+__author__ = 'ahmad.zeeshan@gmail.com (Zeeshan Ahmad)'
+
+
+def make_entities(count):
+    """Return [(name, entities, form class, key field, extra fields)]."""
+    from google.appengine.ext import ndb
+    from models import Conference
+    from models import ConferenceForm
+    from models import Profile
+    from models import ProfileForm
+    from models import Session
+    from models import SessionForm
+    from models import Speaker
+    from models import SpeakerForm
+
+    day = datetime.date(2016, 5, 1)
+    p_key = ndb.Key(Profile, 'organizer@example.com')
+    conferences = [
+        Conference(key=ndb.Key(Conference, i + 1, parent=p_key),
+                   name='Conference %d' % i, description='About %d' % i,
+                   organizerUserId=p_key.id(), topics=TOPICS[:i % 4 + 1],
+                   city=CITIES[i % len(CITIES)], startDate=day,
+                   month=day.month, endDate=day, maxAttendees=100,
+                   seatsAvailable=i % 100)
+        for i in range(count)]
+    sessions = [
+        Session(key=ndb.Key(Session, i + 1, parent=conferences[0].key),
+                name='Session %d' % i, highlights=['one', 'two'],
+                websafeSpeakerKey='speaker', duration=60,
+                typeOfSession=SESSION_TYPES[i % len(SESSION_TYPES)],
+                date=day, startTime=900 + i % 10 * 100)
+        for i in range(count)]
+    speakers = [
+        Speaker(key=ndb.Key(Speaker, i + 1), name='Speaker %d' % i,
+                organization='Org %d' % i, interests=TOPICS[:2])
+        for i in range(count)]
+    profiles = [
+        Profile(key=ndb.Key(Profile, 'user%d@example.com' % i),
+                displayName='User %d' % i, mainEmail='user%d@example.com' % i,
+                conferenceKeysToAttend=[c.key.urlsafe()
+                                        for c in conferences[:3]])
+        for i in range(count)]
+    return [
+        ('Conference', conferences, ConferenceForm, 'websafeKey',
+         {'organizerDisplayName': 'Organizer'}),
+        ('Session', sessions, SessionForm, 'websafeSessionKey', {}),
+        ('Speaker', speakers, SpeakerForm, 'websafeSpeakerKey', {}),
+        ('Profile', profiles, ProfileForm, None, {}),
+    ]
+
+
+def best_time(function, entities, repeat):
+    """Best time, over repeat runs, to call function on all entities."""
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        for entity in entities:
+            function(entity)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sdk', help='path to the App Engine SDK '
+                        '(the directory containing dev_appserver.py)')
+    parser.add_argument('--entities', type=int, default=1000,
+                        help='entities of each kind')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', action='store_true',
+                        help='print results as JSON')
+    options = parser.parse_args()
+
+    setup_sdk(options.sdk)
+    os.environ.setdefault('APPLICATION_ID', 'conference-benchmark')
+    from converters import converter
+    from converters import reflectiveCopy
+
+    results = []
+    for name, entities, form_class, key_field, extra in \
+            make_entities(options.entities):
+        compiled = converter(type(entities[0]), form_class)
+
+        def reflective(entity):
+            return reflectiveCopy(entity, form_class, key_field, **extra)
+
+        def precompiled(entity):
+            return compiled(entity, **extra)
+
+        for entity in entities:
+            if reflective(entity) != precompiled(entity):
+                sys.exit('%s: copies differ for %r' % (name, entity.key))
+
+        reflective_s = best_time(reflective, entities, options.repeat)
+        compiled_s = best_time(precompiled, entities, options.repeat)
+        results.append({
+            'model': name,
+            'reflective_us': reflective_s / len(entities) * 1e6,
+            'compiled_us': compiled_s / len(entities) * 1e6,
+            'speedup': reflective_s / compiled_s,
+        })
+
+    if options.json:
+        print(json.dumps(results, indent=2))
+        return
+    print('%-12s%16s%16s%10s' % ('model', 'reflective us', 'compiled us',
+                                 'speedup'))
+    for result in results:
+        print('%-12s%16.1f%16.1f%9.1fx' % (
+            result['model'], result['reflective_us'],
+            result['compiled_us'], result['speedup']))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,26 @@
 #!/usr/bin/env python
+from collections import Counter
+from collections import OrderedDict
 from datetime import datetime
+from datetime import timedelta
+import hashlib
+import heapq
 import json
+import logging
+import operator
 import os
+import random
+import threading
 import time
 
 import endpoints
 from protorpc import messages
 from protorpc import message_types
+from protorpc import protojson
 from protorpc import remote
 
 from google.appengine.api import urlfetch
+from google.appengine.datastore.datastore_query import Cursor
 from google.appengine.ext import ndb
 
 from models import Profile
@@ -20,11 +31,30 @@ from models import Conference
 from models import ConferenceForm
 from models import Session
 from models import Speaker
+from models import WishlistEntry
+from models import Registration
+from models import AttendeeForm
+from models import AttendeeForms
+from models import SeatShard
+from models import NearlySoldOut
+from models import SpeakerSessionCount
+from models import SpeakerLeaderboard
+from models import FeaturedSpeaker
 
 from settings import WEB_CLIENT_ID
 
 from utils import getUserId
 
+from instrumentation import InstrumentedApplication
+from converters import converter
+from mailer import mailTask
+from mailer import queueMail
+from mailer import queueMailAsync
+from search import MIN_PREFIX_LENGTH
+from search import indexTerm
+from search import score
+from search import tokenize
+
 from models import ConferenceForms
 from models import ConferenceQueryForm
 from models import ConferenceQueryForms
@@ -36,11 +66,18 @@ from google.appengine.api import memcache
 from google.appengine.api import taskqueue
 
 from models import StringMessage
+from models import FeaturedSpeakerMessage
 
 from models import SessionForm
 from models import SpeakerForm
 from models import SpeakerForms
+from models import SpeakerSearchForm
 from models import SessionForms
+from models import ScheduleForm
+from models import ScheduleSessionForm
+from models import SessionBatchForm
+from models import SessionBatchResultForm
+from models import SessionBatchResultForms
 from models import QueryForm
 from models import QueryForms
 from models import ConferenceSessionQueryForm
@@ -64,6 +101,12 @@ Email: ahmad.zeeshaan@gmail.com
 
 __author__ = 'ahmad.zeeshan@gmail.com (Zeeshan Ahmad)'
 
+# precompiled entity to form copies, see converters.py
+CONFERENCE_TO_FORM = converter(Conference, ConferenceForm)
+SESSION_TO_FORM = converter(Session, SessionForm)
+SPEAKER_TO_FORM = converter(Speaker, SpeakerForm)
+PROFILE_TO_FORM = converter(Profile, ProfileForm)
+
 CONF_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeConferenceKey=messages.StringField(1),
@@ -76,6 +119,22 @@ SPEAKER_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeSpeakerKey=messages.StringField(1),
 )
+CONF_ETAG_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    ifNoneMatch=messages.StringField(2),
+)
+CONF_PAGE_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    pageSize=messages.IntegerField(2),
+    pageToken=messages.StringField(3),
+)
+PAGE_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    pageSize=messages.IntegerField(1),
+    pageToken=messages.StringField(2),
+)
 
 EMAIL_SCOPE = endpoints.EMAIL_SCOPE
 API_EXPLORER_CLIENT_ID = endpoints.API_EXPLORER_CLIENT_ID
@@ -96,6 +155,16 @@ OPERATORS = {
             'NE':   '!='
 }
 
+# Python equivalents of OPERATORS, for filters applied in memory
+OPERATOR_FUNCTIONS = {
+    '=': operator.eq,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '!=': operator.ne,
+}
+
 FIELDS = {
     'CITY': 'city',
             'TOPIC': 'topics',
@@ -106,8 +175,78 @@ FIELDS = {
             'ORGANIZATION': 'organization',
 }
 
+# page size used when the client does not ask for one, and the hard upper
+# bound on what a client may ask for in a single page
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# when filters are applied in memory, entities are read in batches of this
+# size, and a page is cut short after scanning this many entities
+POST_FILTER_BATCH_SIZE = 100
+POST_FILTER_SCAN_LIMIT = 1000
+
+# fields of the conference list view that are covered by a composite index
+# in index.yaml, so they can be read with a projection query
+CONFERENCE_PROJECTION = ['name', 'city', 'startDate', 'endDate']
+
+# Profiles are kept on the instance for this many seconds, at most this many
+# of them; writes through this instance drop them, writes through others
+# show after the TTL
+PROFILE_CACHE_TTL = 10
+PROFILE_CACHE_SIZE = 1000
+
+# user ID -> (expiry time, Profile), least recently used first
+_profile_cache = OrderedDict()
+_profile_cache_lock = threading.Lock()
+
+# conferences with at most this many seats left are announced as nearly
+# sold out
+NEARLY_SOLD_OUT_SEATS = 5
+
+# number of SeatShard entities a conference's seat inventory is split into
+SEAT_SHARD_COUNT = 10
+
+# number of speakers kept on each speaker/session-count leaderboard
+SPEAKER_LEADERBOARD_SIZE = 10
+
+# the leaderboard across all conferences is rebuilt by a task, at most once
+# per this many seconds, rather than in every session's transaction
+LEADERBOARD_REBUILD_DELAY = 10
+
+# sessions of at most this many speakers are stored in one transaction: it
+# spans the conference's entity group and one counter per speaker, and xg
+# transactions are limited to 25 entity groups
+MAX_SPEAKERS_PER_TRANSACTION = 24
+
+# speaker search: terms used from a query, speakers ranked per query, and
+# how much a match in each field counts
+MAX_SEARCH_TERMS = 5
+SEARCH_CANDIDATE_LIMIT = 1000
+SEARCH_FIELD_WEIGHTS = {'name': 3, 'organization': 2, 'interests': 1}
+# ranked speaker keys of a search, kept for the following pages
+SEARCH_CACHE_TTL = 60
+
 MEMCACHE_ANNOUNCEMENTS_KEY = 'MEMCACHE_ANNOUNCEMENTS_KEY'
 MEMCACHE_FEATURED_SPEAKER_KEY = 'MEMCACHE_FEATURED_SPEAKER_KEY'
+# featured speaker message of one conference, keyed by its websafe key;
+# cached on reads like the ConferenceForm, with CONFERENCE_CACHE_TTL and
+# CONFERENCE_CACHE_LOCK
+MEMCACHE_CONFERENCE_FEATURED_SPEAKER_KEY = \
+    'MEMCACHE_FEATURED_SPEAKER_KEY:%s'
+# fully built ConferenceForm, keyed by the conference's websafe key; kept
+# for CONFERENCE_CACHE_TTL seconds at most, and not cached again for
+# CONFERENCE_CACHE_LOCK seconds after a change drops it, so a getConference
+# that read the conference before the change can't put the old form back
+MEMCACHE_CONFERENCE_KEY = 'MEMCACHE_CONFERENCE_KEY:%s'
+CONFERENCE_CACHE_TTL = 300
+CONFERENCE_CACHE_LOCK = 5
+# SessionForms of all the sessions of a conference, keyed by its websafe key
+# and contentVersion; new sessions bump the version, so the entries of older
+# versions are never read again and just age out of memcache
+MEMCACHE_CONFERENCE_SESSIONS_KEY = 'MEMCACHE_CONFERENCE_SESSIONS_KEY:%s:%d'
+# (ranked websafe speaker keys, truncated) of a search, keyed by the hash of
+# its terms
+MEMCACHE_SPEAKER_SEARCH_KEY = 'MEMCACHE_SPEAKER_SEARCH_KEY:%s'
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
@@ -123,22 +262,22 @@ class ConferenceApi(remote.Service):
 
     def _copyProfileToForm(self, prof):
         """Copy relevant fields from Profile to ProfileForm."""
-        # copy relevant fields from Profile to ProfileForm
-        pf = ProfileForm()
-        for field in pf.all_fields():
-            if hasattr(prof, field.name):
-                # convert t-shirt string to Enum; just copy others
-                if field.name == 'teeShirtSize':
-                    setattr(pf, field.name, getattr(TeeShirtSize,
-                                                    getattr(prof, field.name)))
-                else:
-                    setattr(pf, field.name, getattr(prof, field.name))
-        pf.check_initialized()
-        return pf
+        # converts t-shirt string to Enum; just copies others
+        return PROFILE_TO_FORM(prof)
 
     def _getProfileFromUser(self):
         """Return user Profile from datastore, creating new one if
-        non-existent."""
+        non-existent.
+
+        The Profile is kept for the rest of the request (endpoints create a
+        ConferenceApi per request) and for PROFILE_CACHE_TTL seconds on the
+        instance. It is created with get_or_insert, so two first requests
+        of a user racing each other can't overwrite one another's Profile.
+        """
+        profile = getattr(self, '_profile', None)
+        if profile:
+            return profile
+
         # TODO 2
         # step 1: make sure user is authed
         # uncomment the following lines:
@@ -146,23 +285,58 @@ class ConferenceApi(remote.Service):
         if not user:
             raise endpoints.UnauthorizedException('Authorization required')
 
-        p_key = ndb.Key(Profile, getUserId(user))
-        profile = None
-        # step 2: create a new Profile from logged in user data
-        # you can use user.nickname() to get displayName
-        # and user.email() to get mainEmail
-        profile = p_key.get()
+        user_id = getUserId(user)
+        profile = self._cachedProfile(user_id)
         if not profile:
-            profile = Profile(
-                key=p_key,
+            # step 2: create a new Profile from logged in user data
+            # you can use user.nickname() to get displayName
+            # and user.email() to get mainEmail
+            profile = Profile.get_or_insert(
+                user_id,
                 displayName=user.nickname(),
                 mainEmail=user.email(),
                 teeShirtSize=str(TeeShirtSize.NOT_SPECIFIED),
             )
-            profile.put()
+            self._cacheProfile(profile)
 
+        self._profile = profile
         return profile      # return Profile
 
+    @staticmethod
+    def _copyProfile(profile):
+        """Copy of a Profile, so cached ones aren't changed by requests."""
+        return Profile(key=profile.key, **profile.to_dict())
+
+    @staticmethod
+    def _cachedProfile(user_id):
+        """Return a copy of the user's Profile from the instance cache, or
+        None if it isn't there or has expired."""
+        with _profile_cache_lock:
+            cached = _profile_cache.pop(user_id, None)
+            if not cached or cached[0] < time.time():
+                return None
+            # most recently used last
+            _profile_cache[user_id] = cached
+        return ConferenceApi._copyProfile(cached[1])
+
+    @staticmethod
+    def _cacheProfile(profile):
+        """Keep a copy of a Profile in the instance cache."""
+        cached = (time.time() + PROFILE_CACHE_TTL,
+                  ConferenceApi._copyProfile(profile))
+        with _profile_cache_lock:
+            _profile_cache.pop(profile.key.id(), None)
+            _profile_cache[profile.key.id()] = cached
+            while len(_profile_cache) > PROFILE_CACHE_SIZE:
+                _profile_cache.popitem(last=False)
+
+    def _invalidateProfile(self, user_id):
+        """Drop the user's Profile from the request's and the instance's
+        caches after it has been written."""
+        self._profile = None
+        with _profile_cache_lock:
+            _profile_cache.pop(user_id, None)
+
     def _doProfile(self, save_request=None):
         """Get user Profile and return to user, possibly updating it first."""
         # get user Profile
@@ -170,12 +344,29 @@ class ConferenceApi(remote.Service):
 
         # if saveProfile(), process user-modifyable fields
         if save_request:
+            # the cached Profile may be a few seconds old; never write it
+            prof = prof.key.get()
+            displayName = prof.displayName
             for field in ('displayName', 'teeShirtSize'):
                 if hasattr(save_request, field):
                     val = getattr(save_request, field)
                     if val:
                         setattr(prof, field, str(val))
-            prof.put()
+            # registrations show the attendee's display name, conferences
+            # the organizer's
+            registrations = []
+            confs = []
+            if prof.displayName != displayName:
+                registrations = Registration.query(ancestor=prof.key).fetch()
+                for registration in registrations:
+                    registration.displayName = prof.displayName
+                confs = Conference.query(ancestor=prof.key).fetch()
+                for conf in confs:
+                    conf.contentVersion += 1
+            ndb.put_multi([prof] + registrations + confs)
+            self._invalidateProfile(prof.key.id())
+            if confs:
+                self._invalidateConferenceCache([conf.key for conf in confs])
 
         # return ProfileForm
         return self._copyProfileToForm(prof)
@@ -197,22 +388,59 @@ class ConferenceApi(remote.Service):
 
 # - - - Conference objects - - - - - - - - - - - - - - - - -
 
-    def _copyConferenceToForm(self, conf, displayName):
-        """Copy relevant fields from Conference to ConferenceForm."""
-        cf = ConferenceForm()
-        for field in cf.all_fields():
-            if hasattr(conf, field.name):
-                # convert Date to date string; just copy others
-                if field.name.endswith('Date'):
-                    setattr(cf, field.name, str(getattr(conf, field.name)))
-                else:
-                    setattr(cf, field.name, getattr(conf, field.name))
-            elif field.name == "websafeKey":
-                setattr(cf, field.name, conf.key.urlsafe())
-        if displayName:
-            setattr(cf, 'organizerDisplayName', displayName)
-        cf.check_initialized()
-        return cf
+    def _copyConferenceToForm(self, conf, displayName, fields=None):
+        """Copy relevant fields from Conference to ConferenceForm, only
+        those in fields if given."""
+        # converts Date to date string; just copies others
+        if displayName and (not fields or 'organizerDisplayName' in fields):
+            return CONFERENCE_TO_FORM(conf, fields or None,
+                                      organizerDisplayName=displayName)
+        return CONFERENCE_TO_FORM(conf, fields or None)
+
+    def _copyConferencesToForms(self, confs, fields=None):
+        """Copy a page of Conferences to ConferenceForms, resolving the
+        organizer display names with a single batch get. If fields is
+        given, only those are copied, and the display names and seat counts
+        are only looked up if asked for."""
+        confs = [conf for conf in confs if conf]
+
+        # organizer Profile is the parent of each Conference; fetch the
+        # distinct ones while the seat shards are being read
+        prof_keys = []
+        if not fields or 'organizerDisplayName' in fields:
+            prof_keys = list(set(conf.key.parent() for conf in confs))
+        prof_futures = ndb.get_multi_async(prof_keys)
+        if not fields or 'seatsAvailable' in fields:
+            self._loadSeatsAvailable(confs)
+
+        names = {}
+        for prof_key, future in zip(prof_keys, prof_futures):
+            prof = future.get_result()
+            if prof:
+                names[prof_key] = prof.displayName
+        return [self._copyConferenceToForm(conf,
+                                           names.get(conf.key.parent(), ""),
+                                           fields)
+                for conf in confs]
+
+    def _fieldMask(self, form_class, fields, key_field):
+        """Validate the fields a client asked for; returns None if it didn't
+        ask, otherwise the set of field names to copy. key_field is always
+        included so results can still be told apart."""
+        if not fields:
+            return None
+        unknown = set(fields) - set(f.name for f in form_class.all_fields())
+        if unknown:
+            raise endpoints.BadRequestException(
+                "Unknown fields: %s" % ', '.join(sorted(unknown)))
+        return set(fields) | set([key_field])
+
+    def _projectionFor(self, fields, projection, key_field):
+        """Return projection if it covers all the requested fields (keys
+        come with any projection query), otherwise None."""
+        if fields and fields - set([key_field]) <= set(projection):
+            return projection
+        return None
 
     def _createConferenceObject(self, request):
         """Create or update Conference object,
@@ -227,6 +455,33 @@ class ConferenceApi(remote.Service):
             raise endpoints.BadRequestException("Conference 'name'\
              field required")
 
+        data = self._conferenceData(request)
+
+        # make Profile Key from user ID
+        p_key = ndb.Key(Profile, user_id)
+        # allocate new Conference ID with Profile key as parent
+        c_id = Conference.allocate_ids(size=1, parent=p_key)[0]
+        # make Conference key from ID
+        c_key = ndb.Key(Conference, c_id, parent=p_key)
+        data['organizerUserId'] = request.organizerUserId = user_id
+        request.websafeKey = c_key.urlsafe()
+
+        # create Conference & return (modified) ConferenceForm
+        ndb.put_multi(self._makeConference(c_key, data))
+        queueMail([mailTask('conference', user.email(), [{
+            'name': data['name'],
+            'description': data['description'],
+            'city': data['city'],
+            'startDate': data['startDate'] and str(data['startDate']),
+            'endDate': data['endDate'] and str(data['endDate']),
+            'topics': data['topics'],
+            'maxAttendees': data['maxAttendees']}])])
+
+        return request
+
+    def _conferenceData(self, request):
+        """Copy a ConferenceForm into a dict of Conference properties,
+        filling in defaults (on the form too) and parsing the dates."""
         # copy ConferenceForm/ProtoRPC Message into dict
         data = {field.name: getattr(request, field.name)
                 for field in request.all_fields()}
@@ -257,24 +512,18 @@ class ConferenceApi(remote.Service):
         if data["maxAttendees"] > 0:
             data["seatsAvailable"] = data["maxAttendees"]
             setattr(request, "seatsAvailable", data["maxAttendees"])
+        return data
 
-        # make Profile Key from user ID
-        p_key = ndb.Key(Profile, user_id)
-        # allocate new Conference ID with Profile key as parent
-        c_id = Conference.allocate_ids(size=1, parent=p_key)[0]
-        # make Conference key from ID
-        c_key = ndb.Key(Conference, c_id, parent=p_key)
+    def _makeConference(self, c_key, data):
+        """Return the unsaved Conference with the given key and properties,
+        followed by its seat shards."""
         data['key'] = c_key
-        data['organizerUserId'] = request.organizerUserId = user_id
 
-        # create Conference & return (modified) ConferenceForm
-        Conference(**data).put()
-        taskqueue.add(params={'email': user.email(),
-                              'conferenceInfo': repr(request)},
-                      url='/tasks/send_confirmation_email'
-                      )
-
-        return request
+        # split the seat inventory into shards so registrations don't all
+        # contend on the Conference entity
+        data['seatShards'] = SEAT_SHARD_COUNT
+        return [Conference(**data)] + \
+            self._makeSeatShards(c_key, data['seatsAvailable'])
 
     @endpoints.method(ConferenceForm, ConferenceForm, path='conference',
                       http_method='POST', name='createConference')
@@ -287,13 +536,23 @@ class ConferenceApi(remote.Service):
                       http_method='POST',
                       name='queryConferences')
     def queryConferences(self, request):
-        """Query for conferences."""
-        conferences = self._getQuery(request)
+        """Query for conferences, one page at a time, optionally only
+        returning the requested fields."""
+        fields = self._fieldMask(ConferenceForm, request.fields, 'websafeKey')
+        q, post_filter = self._getQuery(request)
+
+        # the projection's index only covers the unfiltered list
+        projection = None
+        if not request.filters:
+            projection = self._projectionFor(fields, CONFERENCE_PROJECTION,
+                                             'websafeKey')
+        conferences, next_token = self._fetchPage(q, request, post_filter,
+                                                  projection)
 
         # return individual ConferenceForm object per Conference
         return ConferenceForms(
-            items=[self._copyConferenceToForm(conf, "")
-                   for conf in conferences]
+            items=self._copyConferencesToForms(conferences, fields),
+            nextPageToken=next_token
         )
 
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
@@ -310,14 +569,10 @@ class ConferenceApi(remote.Service):
         p_key = ndb.Key(Profile, getUserId(user))
         # create ancestor query for this user
         conferences = Conference.query(ancestor=p_key)
-        # get the user profile and display name
-        prof = p_key.get()
-        displayName = getattr(prof, 'displayName')
 
         # return set of ConferenceForm objects per Conference
         return ConferenceForms(
-            items=[self._copyConferenceToForm(conf, displayName)
-                   for conf in conferences]
+            items=self._copyConferencesToForms(conferences)
         )  # registers API
 
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
@@ -335,15 +590,20 @@ class ConferenceApi(remote.Service):
         q = q.filter(Conference.topics == "Medical Innovations")
         q = q.order(Conference.name)
         q = q.filter(Conference.month == 12)
-
         return ConferenceForms(
-            items=[self._copyConferenceToForm(conf, "") for conf in q]
+            items=self._copyConferencesToForms(q)
         )
 
     def _getQuery(self, request):
-        """Return formatted query from the submitted filters."""
+        """Return formatted query from the submitted filters, along with the
+        in-memory filter for the ones the datastore can't apply."""
         q = Conference.query()
-        inequality_filter, filters = self._formatFilters(request.filters)
+        inequality_filter, filters, post_filters = self._formatFilters(
+            request.filters)
+
+        for filtr in filters + post_filters:
+            if filtr["field"] in ["month", "maxAttendees"]:
+                filtr["value"] = int(filtr["value"])
 
         # If exists, sort on inequality filter first
         if not inequality_filter:
@@ -353,17 +613,130 @@ class ConferenceApi(remote.Service):
             q = q.order(Conference.name)
 
         for filtr in filters:
-            if filtr["field"] in ["month", "maxAttendees"]:
-                filtr["value"] = int(filtr["value"])
             formatted_query = ndb.query.FilterNode(
                 filtr["field"], filtr["operator"], filtr["value"])
             q = q.filter(formatted_query)
-        return q
+        return q, self._makePostFilter(post_filters)
+
+    def _fetchPage(self, q, request, post_filter=None, projection=None):
+        """Fetch one page of query results.
+
+        Honours request.pageSize (capped at MAX_PAGE_SIZE) and the opaque
+        request.pageToken returned by the previous page. Returns a tuple of
+        (entities, nextPageToken); nextPageToken is None on the last page.
+
+        If post_filter is given, only entities it accepts are returned. The
+        query is then streamed in batches and the page may come back short
+        (with a nextPageToken) once POST_FILTER_SCAN_LIMIT entities have
+        been scanned. projection is passed on to the query.
+        """
+        page_size = self._pageSize(request)
+        cursor = self._startCursor(request.pageToken)
+
+        if not post_filter:
+            results, next_cursor, more = q.fetch_page(page_size,
+                                                      start_cursor=cursor,
+                                                      projection=projection)
+            next_token = next_cursor.urlsafe() \
+                if more and next_cursor else None
+            return results, next_token
+
+        it = q.iter(start_cursor=cursor, produce_cursors=True,
+                    batch_size=POST_FILTER_BATCH_SIZE, projection=projection)
+        results = []
+        scanned = 0
+        for entity in it:
+            scanned += 1
+            if post_filter(entity):
+                results.append(entity)
+            if len(results) >= page_size or \
+                    scanned >= POST_FILTER_SCAN_LIMIT:
+                break
+        else:
+            # query exhausted
+            return results, None
+
+        next_token = it.cursor_after().urlsafe() if it.has_next() else None
+        return results, next_token
+
+    def _pageSize(self, request):
+        """Return the page size asked for in request, capped at
+        MAX_PAGE_SIZE."""
+        page_size = request.pageSize or DEFAULT_PAGE_SIZE
+        if page_size < 0:
+            raise endpoints.BadRequestException(
+                "'pageSize' must be a positive number.")
+        return min(page_size, MAX_PAGE_SIZE)
+
+    def _startCursor(self, pageToken):
+        """Turn a pageToken back into a Cursor; None for the first page."""
+        try:
+            return Cursor(urlsafe=pageToken) if pageToken else None
+        except Exception:
+            raise endpoints.BadRequestException("Invalid 'pageToken'.")
+
+    def _makePostFilter(self, filters):
+        """Return a function telling whether an entity matches all the given
+        filters, or None if there are no filters. Repeated properties match
+        if any of their values does, as in the datastore."""
+        if not filters:
+            return None
+
+        def post_filter(entity):
+            for filtr in filters:
+                compare = OPERATOR_FUNCTIONS[filtr["operator"]]
+                values = getattr(entity, filtr["field"])
+                if not isinstance(values, list):
+                    values = [values]
+                if not any(value is not None and
+                           compare(value, filtr["value"])
+                           for value in values):
+                    return False
+            return True
+        return post_filter
+
+    def _planFilters(self, filters):
+        """Split formatted filters into those for the datastore and those to
+        apply in memory.
+
+        The datastore allows inequalities on one field only, so equalities
+        are always pushed to it along with the inequalities of the single
+        most selective field: a field bounded on both sides beats a field
+        bounded on one side. "!=" filters are always applied in memory as
+        the datastore would split the query in two. Ties go to the field
+        filtered first.
+        Returns (inequality_field, datastore_filters, post_filters).
+        """
+        bounds = {}
+        for filtr in filters:
+            if filtr["operator"] in ("=", "!="):
+                continue
+            bounds.setdefault(filtr["field"], set()).add(
+                'lower' if filtr["operator"] in ('>', '>=') else 'upper')
+
+        inequality_field = None
+        for field in (f["field"] for f in filters):
+            if field in bounds and (inequality_field is None or
+                                    len(bounds[field]) >
+                                    len(bounds[inequality_field])):
+                inequality_field = field
+
+        datastore_filters = []
+        post_filters = []
+        for filtr in filters:
+            if filtr["operator"] == "=" or (
+                    filtr["operator"] != "!=" and
+                    filtr["field"] == inequality_field):
+                datastore_filters.append(filtr)
+            else:
+                post_filters.append(filtr)
+        return (inequality_field, datastore_filters, post_filters)
 
     def _formatFilters(self, filters):
-        """Parse, check validity and format user supplied filters."""
+        """Parse, check validity and format user supplied filters.
+        Returns (inequality_field, datastore_filters, post_filters) as
+        planned by _planFilters()."""
         formatted_filters = []
-        inequality_field = None
 
         for f in filters:
             filtr = {field.name: getattr(f, field.name)
@@ -376,26 +749,157 @@ class ConferenceApi(remote.Service):
                 raise endpoints.BadRequestException("Filter contains \
                     invalid field or operator.")
 
-            # Every operation except "=" is an inequality
-            if filtr["operator"] != "=":
-                # check if inequality operation has been used in previous
-                # filters disallow the filter if inequality was performed
-                # on a different field before
-                # track the field on which the inequality operation
-                # is performed
-                if inequality_field and inequality_field != filtr["field"]:
-                    raise endpoints.BadRequestException(
-                        "Inequality filter is allowed on only one field.")
-                else:
-                    inequality_field = filtr["field"]
-
             formatted_filters.append(filtr)
-        return (inequality_field, formatted_filters)
+        return self._planFilters(formatted_filters)
+
+    @staticmethod
+    def _invalidateConferenceCache(conf_keys):
+        """Drop the cached ConferenceForms of the given conferences, keeping
+        getConference from caching them again for a few seconds."""
+        memcache.delete_multi([MEMCACHE_CONFERENCE_KEY % conf_key.urlsafe()
+                               for conf_key in conf_keys],
+                              seconds=CONFERENCE_CACHE_LOCK)
+
+    @staticmethod
+    def _seatShardKey(conf_key, index):
+        """Return the key of the index-th SeatShard of a conference."""
+        return ndb.Key(SeatShard, '%s:%d' % (conf_key.urlsafe(), index))
+
+    def _makeSeatShards(self, conf_key, seats):
+        """Return SEAT_SHARD_COUNT unsaved SeatShards which together hold
+        the given number of seats."""
+        base, extra = divmod(seats or 0, SEAT_SHARD_COUNT)
+        return [SeatShard(key=self._seatShardKey(conf_key, i),
+                          conference=conf_key,
+                          seatsAvailable=base + (1 if i < extra else 0))
+                for i in range(SEAT_SHARD_COUNT)]
 
     @ndb.transactional(xg=True)
+    def _shardConferenceSeats(self, conf_key):
+        """Move the seat inventory of a conference created before seat
+        sharding into SeatShards. Safe to call more than once."""
+        conf = conf_key.get()
+        if not conf.seatShards:
+            shards = self._makeSeatShards(conf_key, conf.seatsAvailable)
+            conf.seatShards = SEAT_SHARD_COUNT
+            ndb.put_multi([conf] + shards)
+        return conf
+
+    @staticmethod
+    def _loadSeatsAvailable(confs):
+        """Set seatsAvailable on the given (in-memory) conferences to the sum
+        of their seat shards, and seatsVersion to the sum of the shards'
+        versions, using a single batch get."""
+        shard_keys = [ConferenceApi._seatShardKey(conf.key, i)
+                      for conf in confs if conf and conf.seatShards
+                      for i in range(conf.seatShards)]
+        if not shard_keys:
+            return
+        totals = {}
+        versions = {}
+        for shard in ndb.get_multi(shard_keys):
+            if shard:
+                totals[shard.conference] = totals.get(shard.conference, 0) + \
+                    shard.seatsAvailable
+                versions[shard.conference] = \
+                    versions.get(shard.conference, 0) + shard.version
+        for conf in confs:
+            if conf and conf.seatShards:
+                conf.seatsAvailable = totals.get(conf.key, 0)
+                conf.seatsVersion = versions.get(conf.key, 0)
+
+    @staticmethod
+    def _conferenceVersion(conf):
+        """Version of a conference, loaded by _loadSeatsAvailable. Every
+        change to its registrations, sessions, featured speaker or organizer
+        name makes it bigger."""
+        return conf.contentVersion + getattr(conf, 'seatsVersion', 0)
+
+    @staticmethod
+    @ndb.transactional
+    def _bumpConferenceVersion(conf_key, *entities):
+        """Bump a conference's contentVersion, putting the given entities of
+        its entity group in the same transaction. The cached ConferenceForm
+        is dropped once the outermost transaction has committed, so it can't
+        be cached again at the old version in between."""
+        conf = conf_key.get()
+        conf.contentVersion += 1
+        ndb.put_multi([conf] + list(entities))
+        ndb.get_context().call_on_commit(
+            lambda: ConferenceApi._invalidateConferenceCache([conf_key]))
+
+    @staticmethod
+    def _etag(version, *parts):
+        """ETag of a representation of a conference at version; parts, such
+        as the fields asked for, tell the representations apart."""
+        return '"%d-%s"' % (version, hashlib.md5(repr(parts)).hexdigest()[:8])
+
+    def _notModified(self, request, etag):
+        """Whether the client already has the representation with etag,
+        from request.ifNoneMatch or else the If-None-Match header."""
+        ifNoneMatch = request.ifNoneMatch
+        if not ifNoneMatch:
+            headers = getattr(getattr(self, 'request_state', None),
+                              'headers', None)
+            ifNoneMatch = headers and headers.get('If-None-Match')
+        if not ifNoneMatch or not etag:
+            return False
+        tags = [tag.strip() for tag in ifNoneMatch.split(',')]
+        return '*' in tags or etag in tags
+
+    @ndb.transactional(xg=True)
+    def _takeSeatFromShard(self, prof_key, wsck, shard_key):
+        """Register the user on one seat shard. Returns False if that shard
+        has no seats left."""
+        prof = prof_key.get()
+        # check if user already registered otherwise add
+        if wsck in prof.conferenceKeysToAttend:
+            raise ConflictException(
+                "You have already registered for this conference")
+
+        shard = shard_key.get()
+        if not shard or shard.seatsAvailable <= 0:
+            return False
+
+        # register user, take away one seat
+        prof.conferenceKeysToAttend.append(wsck)
+        shard.seatsAvailable -= 1
+        shard.version += 1
+        ndb.put_multi([prof, shard, self._makeRegistration(prof, wsck)])
+        return True
+
+    @staticmethod
+    def _makeRegistration(prof, wsck):
+        """Registration of a user for a conference."""
+        return Registration(key=ndb.Key(Registration, wsck, parent=prof.key),
+                            conference=ndb.Key(urlsafe=wsck),
+                            displayName=prof.displayName)
+
+    @ndb.transactional(xg=True)
+    def _returnSeatToShard(self, prof_key, wsck, shard_key):
+        """Unregister the user, giving the seat back to a shard. Returns
+        False if the user was not registered."""
+        prof = prof_key.get()
+        # check if user already registered
+        if wsck not in prof.conferenceKeysToAttend:
+            return False
+
+        # unregister user, add back one seat
+        shard = shard_key.get()
+        prof.conferenceKeysToAttend.remove(wsck)
+        shard.seatsAvailable += 1
+        shard.version += 1
+        ndb.put_multi([prof, shard])
+        ndb.Key(Registration, wsck, parent=prof_key).delete()
+        return True
+
     def _conferenceRegistration(self, request, reg=True):
-        """Register or unregister user for selected conference."""
-        retval = None
+        """Register or unregister user for selected conference.
+
+        Seats are taken from (or given back to) a randomly chosen SeatShard;
+        each shard update runs in its own transaction together with the user
+        Profile, so a shard never drops below zero and seats are never
+        oversold."""
         prof = self._getProfileFromUser()  # get user Profile
 
         # check if conf exists given websafeConfKey
@@ -405,55 +909,82 @@ class ConferenceApi(remote.Service):
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % wsck)
+        if not conf.seatShards:
+            conf = self._shardConferenceSeats(conf.key)
 
-        # register
-        if reg:
-            # check if user already registered otherwise add
-            if wsck in prof.conferenceKeysToAttend:
-                raise ConflictException(
-                    "You have already registered for this conference")
-
-            # check if seats avail
-            if conf.seatsAvailable <= 0:
-                raise ConflictException(
-                    "There are no seats available.")
+        shard_keys = [self._seatShardKey(conf.key, i)
+                      for i in range(conf.seatShards)]
+        random.shuffle(shard_keys)
 
-            # register user, take away one seat
-            prof.conferenceKeysToAttend.append(wsck)
-            conf.seatsAvailable -= 1
-            retval = True
+        shards = ndb.get_multi(shard_keys)
 
         # unregister
-        else:
-            # check if user already registered
-            if wsck in prof.conferenceKeysToAttend:
-
-                # unregister user, add back one seat
-                prof.conferenceKeysToAttend.remove(wsck)
-                conf.seatsAvailable += 1
-                retval = True
-            else:
-                retval = False
-
-        # write things back to the datastore & return
-        prof.put()
-        conf.put()
-        return BooleanMessage(data=retval)
-
-    @endpoints.method(CONF_GET_REQUEST, ConferenceForm,
+        if not reg:
+            retval = self._returnSeatToShard(prof.key, wsck, shard_keys[0])
+            if retval:
+                self._invalidateProfile(prof.key.id())
+                self._invalidateConferenceCache([conf.key])
+                self._seatsChanged(conf)
+            return BooleanMessage(data=retval)
+
+        # register; checked against the (possibly cached) Profile first, so
+        # a registered user hears so even when the conference is full, and
+        # again in _takeSeatFromShard against the stored one
+        if wsck in prof.conferenceKeysToAttend:
+            raise ConflictException(
+                "You have already registered for this conference")
+
+        # try shards that looked non-empty first; the transaction re-checks
+        candidates = [shard.key for shard in shards
+                      if shard and shard.seatsAvailable > 0]
+        for shard_key in candidates:
+            if self._takeSeatFromShard(prof.key, wsck, shard_key):
+                self._invalidateProfile(prof.key.id())
+                self._invalidateConferenceCache([conf.key])
+                self._seatsChanged(conf)
+                return BooleanMessage(data=True)
+
+        # check if seats avail
+        raise ConflictException(
+            "There are no seats available.")
+
+    @endpoints.method(CONF_ETAG_GET_REQUEST, ConferenceForm,
                       path='conference/{websafeConferenceKey}',
                       http_method='GET', name='getConference')
     def getConference(self, request):
-        """Return requested conference (by websafeConferenceKey)."""
-        # get Conference object from request; bail if not found
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
-        if not conf:
-            raise endpoints.NotFoundException(
-                'No conference found with key: %s' %
-                request.websafeConferenceKey)
-        prof = conf.key.parent().get()
-        # return ConferenceForm
-        return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
+        """Return requested conference (by websafeConferenceKey). If the
+        client sends the etag it already has as ifNoneMatch (or in the
+        If-None-Match header) and the conference hasn't changed, only the
+        key, version and etag come back, with notModified set."""
+        conf_key = ndb.Key(urlsafe=request.websafeConferenceKey)
+        cache_key = MEMCACHE_CONFERENCE_KEY % conf_key.urlsafe()
+        cached = memcache.get(cache_key)
+        if cached:
+            cf = protojson.decode_message(ConferenceForm, cached)
+        else:
+            # get Conference object from request; bail if not found
+            conf = conf_key.get()
+            if not conf:
+                raise endpoints.NotFoundException(
+                    'No conference found with key: %s' %
+                    request.websafeConferenceKey)
+            prof = conf.key.parent().get()
+            self._loadSeatsAvailable([conf])
+            cf = self._copyConferenceToForm(conf,
+                                            getattr(prof, 'displayName'))
+            cf.version = self._conferenceVersion(conf)
+            cf.etag = self._etag(cf.version, 'conference')
+
+            # cache the ConferenceForm until its version changes; add()
+            # fails while a change has just dropped it
+            memcache.add(cache_key, protojson.encode_message(cf),
+                         time=CONFERENCE_CACHE_TTL)
+
+        if self._notModified(request, cf.etag):
+            return ConferenceForm(websafeKey=cf.websafeKey,
+                                  version=cf.version, etag=cf.etag,
+                                  notModified=True)
+        return cf
 
     @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
                       path='conference/register/{websafeConferenceKey}',
@@ -469,6 +1000,53 @@ class ConferenceApi(remote.Service):
         """Unregister user for selected conference."""
         return self._conferenceRegistration(request, False)
 
+    @endpoints.method(CONF_PAGE_GET_REQUEST, AttendeeForms,
+                      path='conference/{websafeConferenceKey}/attendees',
+                      http_method='GET', name='getConferenceAttendees')
+    def getConferenceAttendees(self, request):
+        """Return the users registered for a conference, by display name,
+        one page at a time; only the conference organizer may ask."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+
+        conf_key = ndb.Key(urlsafe=request.websafeConferenceKey)
+        if conf_key.kind() != 'Conference':
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' %
+                request.websafeConferenceKey)
+        # the organizer's Profile is the conference's parent
+        if conf_key.parent() != ndb.Key(Profile, getUserId(user)):
+            raise endpoints.UnauthorizedException('User is not authorized to '\
+            + 'see the attendees of this conference as he/she is not the '\
+            + 'creator of this conference.')
+
+        q = Registration.query(Registration.conference == conf_key)
+        q = q.order(Registration.displayName)
+        registrations, next_token = self._fetchPage(q, request)
+        return AttendeeForms(
+            attendees=[AttendeeForm(displayName=registration.displayName)
+                       for registration in registrations],
+            nextPageToken=next_token
+        )
+
+    @staticmethod
+    def _backfillRegistrations():
+        """
+        Write the Registration entities of registrations made before they
+        existed, from Profile.conferenceKeysToAttend.
+
+        NOTE: This method is being executed using taskqueue from
+        BackfillRegistrationsHandler() in main.py
+        """
+        cursor, more = None, True
+        while more:
+            profiles, cursor, more = Profile.query().fetch_page(
+                POST_FILTER_BATCH_SIZE, start_cursor=cursor)
+            ndb.put_multi([ConferenceApi._makeRegistration(prof, wsck)
+                           for prof in profiles
+                           for wsck in prof.conferenceKeysToAttend])
+
     # endpoint for getting all the conferences for which user has registered
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
                       path='conferences/attending',
@@ -477,11 +1055,7 @@ class ConferenceApi(remote.Service):
         """Get list of conferences that user has registered for."""
         # TODO:
 
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
-
-        # step 1: get user profile
+        # step 1: get user profile (which makes sure the user is authed)
         # make profile key
         prof = self._getProfileFromUser()
 
@@ -493,9 +1067,9 @@ class ConferenceApi(remote.Service):
         # Do not fetch them one by one!
 
         # return set of ConferenceForm objects per Conference
-        return ConferenceForms(items=[self._copyConferenceToForm(conf, "")
-                                      for conf in conferences]
-                               )
+        return ConferenceForms(
+            items=self._copyConferencesToForms(conferences)
+        )
 
     # adds the announcement to memcache if the available seats are less than or
     # equal to 5
@@ -503,45 +1077,121 @@ class ConferenceApi(remote.Service):
     def _cacheAnnouncement():
         """Create Announcement & assign to memcache; used by
         memcache cron job & putAnnouncement().
+
+        Registrations keep the NearlySoldOut set up to date as they happen;
+        this rebuilds it from all the conferences, correcting any drift.
         """
-        confs = Conference.query(ndb.AND(
-            Conference.seatsAvailable <= 5,
-            Conference.seatsAvailable > 0)
-        ).fetch(projection=[Conference.name])
+        # conferences created before seat sharding keep their count on the
+        # Conference entity itself
+        confs = [conf for conf in Conference.query(ndb.AND(
+            Conference.seatsAvailable <= NEARLY_SOLD_OUT_SEATS,
+            Conference.seatsAvailable > 0)) if not conf.seatShards]
+
+        # a sharded conference with 1-5 seats left has every shard at <= 5
+        # and at least one shard above 0, so only those need to be summed
+        shards = SeatShard.query(ndb.AND(
+            SeatShard.seatsAvailable <= NEARLY_SOLD_OUT_SEATS,
+            SeatShard.seatsAvailable > 0))
+        sharded = [conf for conf in
+                   ndb.get_multi(list(set(shard.conference
+                                          for shard in shards)))
+                   if conf]
+        ConferenceApi._loadSeatsAvailable(sharded)
+        confs += [conf for conf in sharded if
+                  0 < conf.seatsAvailable <= NEARLY_SOLD_OUT_SEATS]
+
+        nearlySoldOut = NearlySoldOut(
+            key=ndb.Key(NearlySoldOut, 'announcement'),
+            conferences=[conf.key for conf in confs],
+            names=[conf.name for conf in confs])
+        nearlySoldOut.put()
+        return ConferenceApi._setAnnouncement(nearlySoldOut)
 
-        if confs:
+    @staticmethod
+    def _setAnnouncement(nearlySoldOut):
+        """Format the announcement of the NearlySoldOut conferences and set
+        it in memcache."""
+        announcement = ""
+        if nearlySoldOut and nearlySoldOut.names:
             # If there are almost sold out conferences,
-            # format announcement and set it in memcache
+            # format announcement
             announcement = '%s %s' % (
                 'Last chance to attend! The following conferences '
                 'are nearly sold out:',
-                ', '.join(conf.name for conf in confs))
-            memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
-        else:
-            # If there are no sold out conferences,
-            # delete the memcache announcements entry
-            announcement = ""
-            memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
-
+                ', '.join(nearlySoldOut.names))
+        # an empty announcement is cached too, so that it isn't rebuilt on
+        # every request
+        memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
         return announcement
 
+    @staticmethod
+    def _nearlySoldOut(conf):
+        """Whether a sharded conference has only a few seats left, summing
+        its shards as stored (in a transaction, as of that transaction)."""
+        shards = ndb.get_multi([ConferenceApi._seatShardKey(conf.key, i)
+                                for i in range(conf.seatShards)],
+                               use_cache=False)
+        seats = sum(shard.seatsAvailable for shard in shards if shard)
+        return 0 < seats <= NEARLY_SOLD_OUT_SEATS
+
+    @staticmethod
+    def _seatsChanged(conf):
+        """Once a registration change has committed, add the conference to,
+        or remove it from, the NearlySoldOut set if its seats available,
+        summed again from the shards, crossed the threshold. Concurrent
+        registrations each check after their own commit, so the last one
+        sees the final count."""
+        nearlySoldOut = ndb.Key(NearlySoldOut, 'announcement').get(
+            use_cache=False)
+        listed = bool(nearlySoldOut) and conf.key in nearlySoldOut.conferences
+        if ConferenceApi._nearlySoldOut(conf) != listed:
+            ConferenceApi._setAnnouncement(
+                ConferenceApi._updateNearlySoldOut(conf))
+
+    @staticmethod
+    @ndb.transactional(xg=True)
+    def _updateNearlySoldOut(conf):
+        """Add the conference to the NearlySoldOut set if it is nearly sold
+        out, otherwise remove it. The shards are summed in the transaction,
+        so a registration committing meanwhile makes it retry. Returns the
+        updated set."""
+        key = ndb.Key(NearlySoldOut, 'announcement')
+        nearlySoldOut = key.get() or NearlySoldOut(key=key)
+        nearly = ConferenceApi._nearlySoldOut(conf)
+        if nearly == (conf.key in nearlySoldOut.conferences):
+            return nearlySoldOut
+        if nearly:
+            nearlySoldOut.conferences.append(conf.key)
+            nearlySoldOut.names.append(conf.name)
+        else:
+            i = nearlySoldOut.conferences.index(conf.key)
+            del nearlySoldOut.conferences[i]
+            del nearlySoldOut.names[i]
+        nearlySoldOut.put()
+        return nearlySoldOut
+
     # Gets announcement from memcache
     @endpoints.method(message_types.VoidMessage, StringMessage,
                       path='conference/announcement/get',
                       http_method='GET', name='getAnnouncement')
     def getAnnouncement(self, request):
-        """Return Announcement from memcache."""
+        """Return Announcement from memcache, rebuilding it from the
+        NearlySoldOut set if memcache lost it."""
         # TODO 1
         # return an existing announcement from Memcache or an empty string.
         announcement = memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY)
+        if announcement is None:
+            announcement = self._setAnnouncement(
+                ndb.Key(NearlySoldOut, 'announcement').get())
         return StringMessage(data=announcement)
 
 # ---------------- Session Objects ----------------------
 
-    def _copySessionToForm(self, session):
+    def _copySessionToForm(self, session, fields=None):
         """
         Input:
             session: Session object
+            fields: optional names of the fields to copy, all if None
         Returns:
             SessionForm
         Description:
@@ -549,23 +1199,9 @@ class ConferenceApi(remote.Service):
             side and returns the SessionFrom after copying the relevant fields in
             it which can be returned to client as ProRPC Message.
         """
-        sessionform = SessionForm()
-        for field in sessionform.all_fields():
-            if hasattr(session, field.name):
-                # convert Date to date string; just copy others
-                if field.name.endswith('date'):
-                    setattr(sessionform, field.name,
-                            str(getattr(session, field.name)))
-                else:
-                    setattr(sessionform, field.name,
-                            getattr(session, field.name))
-            # Checks if the field is websafeSessionKey, then converts it into
-            # urlsafe key
-            elif field.name == "websafeSessionKey":
-                setattr(sessionform, field.name, session.key.urlsafe())
-
-        sessionform.check_initialized()
-        return sessionform
+        # converts Date to date string and the key to websafeSessionKey; just
+        # copies others
+        return SESSION_TO_FORM(session, fields or None)
 
 
     def _createSessionObject(self, request):
@@ -592,43 +1228,50 @@ class ConferenceApi(remote.Service):
             raise endpoints.BadRequestException("Session 'name' \
                 field required")
 
-
-        #
-        # conferences = Conference.query(ancestor=p_key)
-        # conferences = conferences.filter()
-
-        conf_key = ndb.Key(urlsafe=request.websafeConferenceKey)
-        conf = conf_key.get()
-
-        if not conf:
-            raise endpoints.NotFoundException(
-                'No conference found with key: %s' %
-                request.websafeConferenceKey)
-
         # Get logged in user's profile key
         p_key = ndb.Key(Profile, user_id)
-
-        # Get conference's parent profile
-        prof = conf.key.parent().get()
-
-        # convert to urlsafe
-        usafep1 = prof.key.urlsafe()
-        usafep2 = p_key.urlsafe()
+        conf_key = ndb.Key(urlsafe=request.websafeConferenceKey)
 
         # Check if user is the one who added the conference. Otherwise throw
         # unauthorized exception because only those users who added conferences
-        # can add sessions to those conferences
-        if usafep1 != usafep2:
+        # can add sessions to those conferences. The conference's parent key
+        # is its creator's profile key, so this needs no datastore lookup.
+        if conf_key.parent() != p_key:
             raise endpoints.UnauthorizedException('User is not authorized to '\
             + 'add new session to this conference as he/she is not the '\
             + 'creator of this conference.')
 
+        # look up the conference & speaker and allocate the session ID
+        # concurrently
         speaker_key = ndb.Key(urlsafe=request.websafeSpeakerKey)
-        speaker = speaker_key.get()
+        conf, speaker, s_id = self._prepareSession(conf_key,
+                                                   speaker_key).get_result()
+
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' %
+                request.websafeConferenceKey)
         if not speaker:
             raise endpoints.NotFoundException(
                 'No speaker found with key: %s' % request.websafeSpeakerKey)
 
+        data = self._sessionData(request)
+        s_key = ndb.Key(Session, s_id, parent=conf_key)
+        data['key'] = s_key
+
+        # create Session, count it for its speaker & return SessionForm
+        session = Session(**data)
+        self._putSessions([session])
+
+        self._queueSessionTasks(user.email(), request.websafeConferenceKey,
+                                conf, [(session, speaker)])
+
+        # Return data as SessionForm
+        return self._copySessionToForm(session)
+
+
+    def _sessionData(self, request):
+        """Copy a SessionForm into a dict of Session properties."""
         data = {field.name: getattr(request, field.name)
                 for field in request.all_fields()}
         del data['websafeSessionKey']
@@ -637,59 +1280,174 @@ class ConferenceApi(remote.Service):
         if data['date']:
             data['date'] = datetime.strptime(data['date'][:10],
                                              "%Y-%m-%d").date()
+        return data
+
+    def _queueSessionTasks(self, email, websafeConferenceKey, conf,
+                           created):
+        """Queue one confirmation email listing the new sessions and the
+        featured speaker task of their conference; created is a list of
+        (Session, Speaker). The two tasks go to different queues, so they
+        are added with two calls, made concurrently."""
+        rpcs = queueMailAsync([mailTask('session', email, [
+            self._sessionMailFields(session, conf, speaker)
+            for session, speaker in created])])
+        rpcs.append(taskqueue.Queue().add_async(self._featuredSpeakerTask(
+            websafeConferenceKey,
+            [speaker for _, speaker in created])))
+        for rpc in rpcs:
+            rpc.get_result()
+
+    def _featuredSpeakerTask(self, websafeConferenceKey, speakers):
+        """Task recomputing the featured speaker of a conference after the
+        given Speakers got new sessions in it."""
+        speakers = dict((speaker.key, speaker) for speaker in speakers)
+        speakers = speakers.values()
+        return taskqueue.Task(
+            params={'websafeConferenceKey': websafeConferenceKey,
+                    'websafeSpeakerKey': [speaker.key.urlsafe()
+                                          for speaker in speakers],
+                    'speaker': [speaker.name for speaker in speakers]},
+            url='/tasks/set_featured_speaker')
+
+    def _createSessionObjects(self, request):
+        """
+        Input:
+            request: SessionBatchForm with the websafeConferenceKey and the
+                sessions to add to that conference
+        Returns:
+            SessionBatchResultForms with, for each session in the request,
+            either the created SessionForm or the reason it was rejected
+        Description:
+            Bulk version of _createSessionObject. The conference and all the
+            speakers are looked up once, the session IDs are allocated with a
+            single call, the sessions are written with one put_multi in one
+            transaction that also counts them for all their speakers (split
+            only past MAX_SPEAKERS_PER_TRANSACTION speakers), and a single
+            confirmation email and featured speaker task are enqueued for
+            the whole batch.
+        """
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        p_key = ndb.Key(Profile, getUserId(user))
 
-        s_id = Session.allocate_ids(size=1, parent=conf_key)[0]
-
-        s_key = ndb.Key(Session, s_id, parent=conf_key)
-        data['key'] = s_key
-
-        # create Conference & return (modified) ConferenceForm
-        Session(**data).put()
-        taskqueue.add(params={'email': user.email(),
-                              'sessionInfo': repr(request)},
-                      url='/tasks/send_session_confirmation_email'
-                      )
-
-        taskqueue.add(params={'websafeConferenceKey': \
-                                request.websafeConferenceKey,
-                              'websafeSpeakerKey': request.websafeSpeakerKey,
-                              'speaker': speaker.name},
-                      url='/tasks/set_featured_speaker'
-                      )
-
-        # Return data as SessionForm. Cannot use self._copySessionToForm as
-        # that method implementation looks for session object instead data dict
-        # and changing the implementation of that method affects the query
-        # endpoints
-        sessionform = SessionForm()
-
-        for field in sessionform.all_fields():
-            if data.has_key(field.name):
-                # convert Date to date string; just copy others
-                if field.name.endswith('date'):
-                    setattr(sessionform, field.name,
-                            str(data[field.name]))
-                else:
-                    setattr(sessionform, field.name,
-                            data[field.name])
-            # Checks if the field is websafeSessionKey, then converts it into
-            # urlsafe key
-            elif field.name == "websafeSessionKey":
-                setattr(sessionform, field.name, data['key'].urlsafe())
-
-        sessionform.check_initialized()
-        return sessionform
+        conf_key = ndb.Key(urlsafe=request.websafeConferenceKey)
+        if conf_key.parent() != p_key:
+            raise endpoints.UnauthorizedException('User is not authorized to '\
+            + 'add new sessions to this conference as he/she is not the '\
+            + 'creator of this conference.')
 
+        # parse the speaker keys, then fetch the conference and the
+        # distinct speakers in one batch
+        results = [SessionBatchResultForm(index=i)
+                   for i in range(len(request.sessions))]
+        speaker_keys = {}
+        for result, form in zip(results, request.sessions):
+            try:
+                speaker_keys[form.websafeSpeakerKey] = ndb.Key(
+                    urlsafe=form.websafeSpeakerKey)
+            except Exception:
+                result.error = 'Invalid websafeSpeakerKey: %s' % \
+                    form.websafeSpeakerKey
+        entities = ndb.get_multi([conf_key] + speaker_keys.values())
+        if not entities[0]:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' %
+                request.websafeConferenceKey)
+        speakers = dict(zip(speaker_keys.keys(), entities[1:]))
+
+        # validate each session on its own
+        valid = []
+        for result, form in zip(results, request.sessions):
+            if result.error:
+                continue
+            if not form.name:
+                result.error = "Session 'name' field required"
+            elif not speakers[form.websafeSpeakerKey]:
+                result.error = 'No speaker found with key: %s' % \
+                    form.websafeSpeakerKey
+            else:
+                try:
+                    valid.append((result, self._sessionData(form)))
+                except ValueError:
+                    result.error = "Session 'date' must be YYYY-MM-DD"
+        if not valid:
+            return SessionBatchResultForms(results=results)
+
+        # allocate all the IDs at once
+        first, _ = Session.allocate_ids(size=len(valid), parent=conf_key)
+        created = []
+        for s_id, (result, data) in enumerate(valid, first):
+            data['key'] = ndb.Key(Session, s_id, parent=conf_key)
+            created.append((result, Session(**data)))
+
+        results_of = dict((session.key, result)
+                          for result, session in created)
+        for batch in self._sessionBatches([s for _, s in created]):
+            try:
+                self._putSessions(batch)
+            except Exception:
+                logging.exception('Could not create %d sessions of %s',
+                                  len(batch), request.websafeConferenceKey)
+                for session in batch:
+                    results_of[session.key].error = \
+                        'Could not store the session'
+                continue
+            for session in batch:
+                result = results_of[session.key]
+                result.session = self._copySessionToForm(session)
+                result.session.websafeConferenceKey = \
+                    request.websafeConferenceKey
+
+        # in the order of the request
+        stored = [session for result, session in created if result.session]
+        if stored:
+            self._queueSessionTasks(
+                user.email(), request.websafeConferenceKey, entities[0],
+                [(session, speakers[session.websafeSpeakerKey])
+                 for session in stored])
+        return SessionBatchResultForms(results=results)
+
+    def _sessionMailFields(self, session, conf, speaker):
+        """Fields of a new session shown in its confirmation email."""
+        return {
+            'name': session.name,
+            'conference': conf.name,
+            'speaker': speaker.name,
+            'typeOfSession': session.typeOfSession,
+            'date': session.date and str(session.date),
+            'startTime': session.startTime is not None and
+            '%02d:%02d' % divmod(session.startTime, 100) or None,
+            'duration': session.duration,
+            'highlights': session.highlights,
+        }
+
+    @ndb.tasklet
+    def _prepareSession(self, conf_key, speaker_key):
+        """Tasklet fetching a new session's conference and speaker while
+        allocating its ID; resolves to (conference, speaker, session ID)."""
+        conf, speaker, ids = yield (conf_key.get_async(),
+                                    speaker_key.get_async(),
+                                    Session.allocate_ids_async(
+                                        size=1, parent=conf_key))
+        raise ndb.Return(conf, speaker, ids[0])
 
     @staticmethod
     def _setFeaturedSpeaker(self, websafeConferenceKey,
-        websafeSpeakerKey, speaker):
+        websafeSpeakerKeys, speakers):
         """
-        Input: websafeConferenceKey, websafeSpeakerKey, speaker
+        Input: websafeConferenceKey, websafeSpeakerKeys and speakers (names)
+            of the speakers who just got new sessions
         Returns: Doesn't return anything
-        Description: this method checks if the speaker has more than one sessions,
-        within the same conference and adds a message in memcache mentioning the
-        speaker name as featured speaker and session names he/she is delivering.
+        Description: this method checks which of the speakers has the most
+        sessions within the same conference and, if that is more than one,
+        makes him/her the featured speaker of that conference, storing the
+        speaker name and session names he/she is delivering and adding the
+        message in memcache.
+
+        The session names come from the conference's SpeakerSessionCount for
+        the speaker, which is updated along with every new session, so no
+        sessions are queried.
 
         NOTE: This method is being executed using taskqueue from
         SetFeaturedSpeakerHandler() in main.py
@@ -697,38 +1455,66 @@ class ConferenceApi(remote.Service):
         # ---------  add featured speaker to memcache -----------
 
         conf_key = ndb.Key(urlsafe=websafeConferenceKey)
-        # Gets all the sessions for current Conference
-        sessions = Session.query(ancestor=conf_key)
-        # Filters the returned sessions based on speaker
-        sessions = sessions.filter(Session.websafeSpeakerKey ==
-                                   websafeSpeakerKey)
-        sessions = sessions.fetch()
-
-        # Checks if the more than one sessions were returned for current
+        names = {}
+        for websafeSpeakerKey, speaker in zip(websafeSpeakerKeys, speakers):
+            names[ndb.Key(urlsafe=websafeSpeakerKey)] = speaker
+        counters = [counter for counter in ndb.get_multi([
+            ConferenceApi._speakerCountKey(conf_key, speaker_key)
+            for speaker_key in names]) if counter]
+        counter = max(counters, key=lambda c: c.count) if counters else None
+
+        # Checks if the more than one sessions were counted for that
         # speaker
-        if len(sessions) > 1:
-            featuredSpeakerMessage = speaker + " is featured speaker " + \
-                "and he will be delivering talk in following sessions. "
-            sessionsCSV = ""
-            # building a comma separated list of session names where featured
-            # speaker is speaking
-            for session in sessions:
-                sessionsCSV += session.name + ", "
-
-            featuredSpeakerMessage = featuredSpeakerMessage + \
-                sessionsCSV[:-2] + "."
-
-            memcache.set(MEMCACHE_FEATURED_SPEAKER_KEY, featuredSpeakerMessage)
+        if counter and counter.count > 1:
+            featured = FeaturedSpeaker(
+                key=ndb.Key(FeaturedSpeaker, 'featured', parent=conf_key),
+                speaker=counter.speaker,
+                speakerName=names[counter.speaker],
+                sessionNames=counter.sessionNames)
+            ConferenceApi._bumpConferenceVersion(conf_key, featured)
+
+            # the conference's message is read through from the stored
+            # FeaturedSpeaker; drop it now that the new one has committed,
+            # keeping readers that loaded the old one from caching it again
+            memcache.delete(MEMCACHE_CONFERENCE_FEATURED_SPEAKER_KEY %
+                            conf_key.urlsafe(),
+                            seconds=CONFERENCE_CACHE_LOCK)
+            memcache.set(MEMCACHE_FEATURED_SPEAKER_KEY,
+                         ConferenceApi._featuredSpeakerMessage(featured))
 
+    @staticmethod
+    def _featuredSpeakerMessage(featured):
+        """Format the announcement for a FeaturedSpeaker."""
+        return featured.speakerName + " is featured speaker " + \
+            "and he will be delivering talk in following sessions. " + \
+            ", ".join(featured.sessionNames) + "."
 
-    def _getFeaturedSpeaker(self):
+    def _getFeaturedSpeaker(self, websafeConferenceKey=None):
         """
-        It retrieves the featured speaker and the session names from memcache
+        It retrieves the featured speaker and the session names from memcache,
+        either the latest one of any conference or the one of the conference
+        given by websafeConferenceKey. The latter is rebuilt from the stored
+        FeaturedSpeaker when it is not in memcache.
         """
-        return memcache.get(MEMCACHE_FEATURED_SPEAKER_KEY)
-
+        if not websafeConferenceKey:
+            return memcache.get(MEMCACHE_FEATURED_SPEAKER_KEY)
 
-    @endpoints.method(message_types.VoidMessage, StringMessage,
+        conf_key = ndb.Key(urlsafe=websafeConferenceKey)
+        cache_key = MEMCACHE_CONFERENCE_FEATURED_SPEAKER_KEY % \
+            conf_key.urlsafe()
+        featuredSpeaker = memcache.get(cache_key)
+        if featuredSpeaker is None:
+            featured = ndb.Key(FeaturedSpeaker, 'featured',
+                               parent=conf_key).get()
+            featuredSpeaker = self._featuredSpeakerMessage(featured) \
+                if featured else ""
+            # add() fails while _setFeaturedSpeaker has just dropped it, so
+            # a message read before that can't be cached over the new one
+            memcache.add(cache_key, featuredSpeaker,
+                         time=CONFERENCE_CACHE_TTL)
+        return featuredSpeaker
+
+    @endpoints.method(CONF_ETAG_GET_REQUEST, FeaturedSpeakerMessage,
                       path='getfeaturedspeaker',
                       http_method='GET', name='getFeaturedSpeaker')
     def getFeaturedSpeaker(self, request):
@@ -736,24 +1522,88 @@ class ConferenceApi(remote.Service):
         getFeaturedSpeaker endpoint recieves the calls from client to get the
         featured speaker information from memcache
 
-        Input: It doesn't require any input parameters
-        Returns: String message about featured speaker and his/her sessions
+        Input: optional websafeConferenceKey to get the featured speaker of
+            that conference instead of the latest one of any conference,
+            and then optional ifNoneMatch, the etag the client already has
+        Returns: String message about featured speaker and his/her sessions,
+            with the conference's version and etag; only those and
+            notModified if the client's etag is still current
         """
-        featuredSpeaker = memcache.get(MEMCACHE_FEATURED_SPEAKER_KEY)
-        return StringMessage(data=featuredSpeaker or "No Featured Speaker")
+        if not request.websafeConferenceKey:
+            featuredSpeaker = self._getFeaturedSpeaker()
+            return FeaturedSpeakerMessage(
+                data=featuredSpeaker or "No Featured Speaker")
+
+        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' %
+                request.websafeConferenceKey)
+        etag = self._etag(conf.contentVersion, 'featuredSpeaker')
+        if self._notModified(request, etag):
+            return FeaturedSpeakerMessage(version=conf.contentVersion,
+                                          etag=etag, notModified=True)
+
+        featuredSpeaker = self._getFeaturedSpeaker(
+            request.websafeConferenceKey)
+        return FeaturedSpeakerMessage(
+            data=featuredSpeaker or "No Featured Speaker",
+            version=conf.contentVersion, etag=etag)
 
     def _getConferenceSessions(self, request):
         """
         Description: Retrieves all the sessions in a conference and returns as
         SessionForms object
         """
-        conf_key = ndb.Key(urlsafe=request.websafeConferenceKey)
-        sessions = Session.query(ancestor=conf_key)
+        fields = self._fieldMask(SessionForm, request.fields,
+                                 'websafeSessionKey')
+        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' %
+                request.websafeConferenceKey)
+
+        # new sessions bump the conference's contentVersion
+        etag = self._etag(conf.contentVersion, 'sessions',
+                          sorted(fields or []))
+        if self._notModified(request, etag):
+            return SessionForms(version=conf.contentVersion, etag=etag,
+                                notModified=True)
+
         return SessionForms(
-            sessions=[self._copySessionToForm(session)
-                      for session in sessions]
+            sessions=self._maskSessionForms(
+                self._conferenceSessionForms(conf), fields),
+            version=conf.contentVersion,
+            etag=etag
         )
 
+    def _conferenceSessionForms(self, conf):
+        """
+        Returns SessionForms of all the sessions of a conference, from
+        memcache if they were cached at the conference's current
+        contentVersion, otherwise from an ancestor query, caching them.
+        """
+        cache_key = MEMCACHE_CONFERENCE_SESSIONS_KEY % (conf.key.urlsafe(),
+                                                        conf.contentVersion)
+        cached = memcache.get(cache_key)
+        if cached is not None:
+            return protojson.decode_message(SessionForms, cached).sessions
+
+        forms = [self._copySessionToForm(session)
+                 for session in Session.query(ancestor=conf.key)]
+        memcache.set(cache_key,
+                     protojson.encode_message(SessionForms(sessions=forms)))
+        return forms
+
+    def _maskSessionForms(self, forms, fields):
+        """Clear the fields of forms not in fields (if given)."""
+        if fields:
+            for form in forms:
+                for field in form.all_fields():
+                    if field.name not in fields:
+                        form.reset(field.name)
+        return forms
+
     def _getConferenceSessionsByType(self, request):
         """
         Input: request contains
@@ -762,17 +1612,19 @@ class ConferenceApi(remote.Service):
         Retrieves all the sessions in a conference filtered by type and
         Returns as SessionForms object
         """
-        conf_key = ndb.Key(urlsafe=request.websafeConferenceKey)
-        # First filter the sessions on parent conference based
-        # websafeConferenceKey provided by client
-        sessions = Session.query(ancestor=conf_key)
+        fields = self._fieldMask(SessionForm, request.fields,
+                                 'websafeSessionKey')
+        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' %
+                request.websafeConferenceKey)
 
-        # Filter resulting sessions by typeOfSession
-        sessions = sessions.filter(Session.typeOfSession ==
-                                   request.typeOfSession)
+        # Filter the conference's (cached) sessions by typeOfSession
+        sessions = [form for form in self._conferenceSessionForms(conf)
+                    if form.typeOfSession == request.typeOfSession]
         return SessionForms(
-            sessions=[self._copySessionToForm(session)
-                      for session in sessions]
+            sessions=self._maskSessionForms(sessions, fields)
         )
 
 
@@ -787,8 +1639,10 @@ class ConferenceApi(remote.Service):
         # Filters based on websafeSpeakerKey
         sessions = sessions.filter(Session.websafeSpeakerKey ==
                                    request.websafeSpeakerKey)
+        fields = self._fieldMask(SessionForm, request.fields,
+                                 'websafeSessionKey')
         return SessionForms(
-            sessions=[self._copySessionToForm(session)
+            sessions=[self._copySessionToForm(session, fields)
                       for session in sessions]
         )
 
@@ -808,6 +1662,20 @@ class ConferenceApi(remote.Service):
         return self._createSessionObject(request)
 
 
+    @endpoints.method(SessionBatchForm, SessionBatchResultForms,
+                      path='sessions', http_method='POST',
+                      name='createSessions')
+    def createSessions(self, request):
+        """
+        Creates many sessions of one conference at once, e.g. when importing
+        a conference programme.
+        Input: websafeConferenceKey and a list of sessions, each taking the
+            same fields as createSession
+        Returns: one result per session, in the order given, holding either
+            the created session or the error that kept it from being created
+        """
+        return self._createSessionObjects(request)
+
     @endpoints.method(ConferenceSessionQueryForm,
                       SessionForms, path='session/conference',
                       http_method='POST', name='queryConferenceSessions')
@@ -873,8 +1741,10 @@ class ConferenceApi(remote.Service):
 
         # Filtering further based on matching duration
         sessions = sessions.filter(Session.duration == request.duration)
+        fields = self._fieldMask(SessionForm, request.fields,
+                                 'websafeSessionKey')
         return SessionForms(
-            sessions=[self._copySessionToForm(session)
+            sessions=[self._copySessionToForm(session, fields)
                       for session in sessions]
         )
 
@@ -901,8 +1771,10 @@ class ConferenceApi(remote.Service):
         sessions = sessions.filter(Session.startTime >= request.startTime)
         sessions = sessions.filter(Session.duration == request.duration)
         sessions = sessions.filter(Session.highlights == request.highlights)
+        fields = self._fieldMask(SessionForm, request.fields,
+                                 'websafeSessionKey')
         return SessionForms(
-            sessions=[self._copySessionToForm(session)
+            sessions=[self._copySessionToForm(session, fields)
                       for session in sessions]
         )
 
@@ -925,66 +1797,356 @@ class ConferenceApi(remote.Service):
         """
         sessions = Session.query()
         sessions = sessions.filter(Session.startTime == request.startTime)
+        fields = self._fieldMask(SessionForm, request.fields,
+                                 'websafeSessionKey')
         return SessionForms(
-            sessions=[self._copySessionToForm(session)
+            sessions=[self._copySessionToForm(session, fields)
                       for session in sessions]
         )
 
-    @endpoints.method(message_types.VoidMessage, SpeakerForm,
+    @endpoints.method(CONF_GET_REQUEST, SpeakerForm,
                       path='session/speakerwithmostsessions',
                       http_method='POST',
                       name='getSpeakerWithHighestNumberOfSessions')
     def getSpeakerWithHighestNumberOfSessions(self, request):
         """
-        getSpeakerWithHighestNumberOfSessions endpoint: Gets all the
-        sessions and their speakers websafe keys.
+        getSpeakerWithHighestNumberOfSessions endpoint: Gets the speaker who
+        delivers the most sessions, optionally only counting the sessions of
+        the conference given by websafeConferenceKey.
         """
         return self._getSpeakerWithHighestNumberOfSessions(request)
 
     def _getSpeakerWithHighestNumberOfSessions(self, request):
         """
-        _getSpeakerWithHighestNumberOfSessions: gets all the sessions and their
-        speakers websafe keys.
-        Uses max() method to determine the highest occuring websafeSpeakerKey in
-        resulting speaker keys and gets that speaker's information. Hence, the
-        speaker with highest number of sessions
+        _getSpeakerWithHighestNumberOfSessions: reads the top of the speaker
+        leaderboard, across all conferences or within the conference given
+        by websafeConferenceKey, and returns that speaker's information.
+        Leaderboards are kept up to date as sessions are created, so this
+        doesn't look at any Session.
         """
-        sessions = Session.query()
-        websafeSpeakerKeys = [session.websafeSpeakerKey
-                              for session in sessions]
-        # Checks for highest count of websafeSpeakerKeys and retrieves that
-        # speaker key
-        speaker_key = ndb.Key(urlsafe=max(set(websafeSpeakerKeys),
-                                          key=websafeSpeakerKeys.count))
-        speaker = speaker_key.get()
+        scope = None
+        if request.websafeConferenceKey:
+            scope = ndb.Key(urlsafe=request.websafeConferenceKey)
+        board = self._speakerBoardKey(scope).get()
+
+        # the board is only exact while its leader beats every speaker that
+        # fell off it; otherwise rank the counters for this call and leave
+        # storing the board to a task
+        if not board and scope is None or \
+                board and (not board.counts or board.counts[0] < board.floor):
+            board = self._rankSpeakers(scope)
+            self._scheduleLeaderboardRebuild(scope)
+
+        if not board or not board.speakers:
+            raise endpoints.NotFoundException('No sessions found')
+        speaker = board.speakers[0].get()
         return self._copySpeakerToForm(speaker=speaker)
 
+    @staticmethod
+    def _speakerCountKey(scope, speaker_key):
+        """Key of a speaker's session counter; scope is a conference key, or
+        None for the count across all conferences."""
+        return ndb.Key(SpeakerSessionCount, speaker_key.urlsafe(),
+                       parent=scope)
+
+    @staticmethod
+    def _speakerBoardKey(scope):
+        """Key of the speaker leaderboard for a conference key, or None for
+        the leaderboard across all conferences."""
+        return ndb.Key(SpeakerLeaderboard, 'sessions', parent=scope)
+
+    @staticmethod
+    def _rankOnLeaderboard(board, speaker_key, count):
+        """Record a speaker's new session count on a leaderboard. Returns
+        True if the board changed."""
+        entries = dict(zip(board.speakers, board.counts))
+        if speaker_key not in entries and count <= board.floor and \
+                len(entries) >= SPEAKER_LEADERBOARD_SIZE:
+            return False
+
+        if count > 0:
+            entries[speaker_key] = count
+        else:
+            entries.pop(speaker_key, None)
+        ranked = sorted(entries.items(), key=lambda e: e[1], reverse=True)
+
+        # remember the best count that didn't make the board
+        for _, dropped in ranked[SPEAKER_LEADERBOARD_SIZE:]:
+            board.floor = max(board.floor, dropped)
+        ranked = ranked[:SPEAKER_LEADERBOARD_SIZE]
+        board.speakers = [key for key, _ in ranked]
+        board.counts = [c for _, c in ranked]
+        return True
+
+    def _changeSpeakerSessionCounts(self, conf_key, sessions, delta):
+        """Count sessions of conf_key (delta=1) or uncount them (delta=-1)
+        in their speakers' session counters, both across all conferences and
+        within conf_key, and on the leaderboard of conf_key; the conference
+        counters also keep the session names. All of it is read with one
+        get_multi and written with one put_multi. The leaderboard across all
+        conferences is a single entity, so it is rebuilt by a task once the
+        transaction has committed. Must be called inside an xg transaction
+        together with the Session writes or deletes."""
+        sessionNames = OrderedDict()
+        for session in sessions:
+            if session.websafeSpeakerKey:
+                sessionNames.setdefault(
+                    ndb.Key(urlsafe=session.websafeSpeakerKey),
+                    []).append(session.name)
+        if not sessionNames:
+            return
+
+        counter_keys = [self._speakerCountKey(scope, speaker_key)
+                        for speaker_key in sessionNames
+                        for scope in (None, conf_key)]
+        entities = ndb.get_multi([self._speakerBoardKey(conf_key)] +
+                                 counter_keys)
+        board = entities[0] or \
+            SpeakerLeaderboard(key=self._speakerBoardKey(conf_key))
+        counters = iter(entities[1:])
+
+        changed = []
+        board_changed = False
+        for speaker_key, names in sessionNames.items():
+            for scope in (None, conf_key):
+                counter = next(counters) or SpeakerSessionCount(
+                    key=self._speakerCountKey(scope, speaker_key),
+                    speaker=speaker_key, conference=scope)
+                counter.count = max(counter.count + delta * len(names), 0)
+                for sessionName in names if scope else []:
+                    if delta > 0:
+                        counter.sessionNames.append(sessionName)
+                    elif sessionName in counter.sessionNames:
+                        counter.sessionNames.remove(sessionName)
+                changed.append(counter)
+                if scope and self._rankOnLeaderboard(board, speaker_key,
+                                                     counter.count):
+                    board_changed = True
+        ndb.put_multi(changed + ([board] if board_changed else []))
+        ndb.get_context().call_on_commit(
+            lambda: ConferenceApi._scheduleLeaderboardRebuild(None))
+
+    @staticmethod
+    def _scheduleLeaderboardRebuild(scope):
+        """Enqueue the rebuild of a speaker leaderboard (scope is a
+        conference key, or None for the one across all conferences). Tasks
+        are named after the scope and the current LEADERBOARD_REBUILD_DELAY
+        window, so the board is rebuilt at most once per window however many
+        sessions are created; the task runs a window after its window ends,
+        so it sees every change made in it."""
+        websafeConferenceKey = scope.urlsafe() if scope else ''
+        now = time.time()
+        window = int(now) // LEADERBOARD_REBUILD_DELAY
+        try:
+            taskqueue.add(
+                name='speaker-board-%s-%d' % (websafeConferenceKey or 'all',
+                                              window),
+                params={'websafeConferenceKey': websafeConferenceKey},
+                url='/tasks/rebuild_speaker_leaderboard',
+                countdown=(window + 2) * LEADERBOARD_REBUILD_DELAY - now)
+        except (taskqueue.TaskAlreadyExistsError,
+                taskqueue.TombstonedTaskError):
+            pass
+
+    @ndb.transactional(xg=True)
+    def _putSessions(self, sessions):
+        """Store new Sessions of one conference, of at most
+        MAX_SPEAKERS_PER_TRANSACTION speakers (see _sessionBatches), bump
+        the conference's version and count them towards their speakers'
+        totals, all in one transaction."""
+        conf_key = sessions[0].key.parent()
+        self._bumpConferenceVersion(conf_key, *sessions)
+        self._changeSpeakerSessionCounts(conf_key, sessions, 1)
+
+    @staticmethod
+    def _sessionBatches(sessions):
+        """Split new Sessions of one conference into the lists _putSessions
+        stores in one transaction each: usually a single one, unless they
+        have more than MAX_SPEAKERS_PER_TRANSACTION speakers."""
+        batches = []
+        speakers = set()
+        for session in sessions:
+            if session.websafeSpeakerKey not in speakers:
+                if not batches or \
+                        len(speakers) == MAX_SPEAKERS_PER_TRANSACTION:
+                    batches.append([])
+                    speakers = set()
+                speakers.add(session.websafeSpeakerKey)
+            batches[-1].append(session)
+        return batches
+
+    @staticmethod
+    def _rankSpeakers(scope):
+        """Compute a speaker leaderboard from the session counters, without
+        storing it."""
+        counters = SpeakerSessionCount.query(
+            SpeakerSessionCount.conference == scope).order(
+            -SpeakerSessionCount.count).fetch(SPEAKER_LEADERBOARD_SIZE + 1)
+        counters = [counter for counter in counters if counter.count > 0]
+
+        return SpeakerLeaderboard(
+            key=ConferenceApi._speakerBoardKey(scope),
+            speakers=[c.speaker for c in counters[:SPEAKER_LEADERBOARD_SIZE]],
+            counts=[c.count for c in counters[:SPEAKER_LEADERBOARD_SIZE]],
+            floor=counters[SPEAKER_LEADERBOARD_SIZE].count
+            if len(counters) > SPEAKER_LEADERBOARD_SIZE else 0)
+
+    @staticmethod
+    def _rebuildSpeakerLeaderboard(scope):
+        """
+        Recompute a speaker leaderboard from the session counters and store
+        it. The counters query is eventually consistent, so it only picks
+        the speakers to rank; see _storeSpeakerLeaderboard.
+
+        NOTE: This method is being executed using taskqueue from
+        RebuildSpeakerLeaderboardHandler() in main.py
+        """
+        return ConferenceApi._storeSpeakerLeaderboard(
+            ConferenceApi._rankSpeakers(scope))
+
+    @staticmethod
+    @ndb.transactional(xg=True)
+    def _storeSpeakerLeaderboard(ranked):
+        """Store a leaderboard computed by _rankSpeakers, re-ranking its
+        speakers and those on the stored board by their counters read by
+        key. A session counted meanwhile has either committed and is read
+        here, or makes this transaction retry, so it is never overwritten.
+        Both boards hold at most SPEAKER_LEADERBOARD_SIZE speakers, so this
+        stays within the entity groups of an xg transaction."""
+        stored = ranked.key.get()
+        speakers = list(ranked.speakers)
+        for speaker_key in stored.speakers if stored else []:
+            if speaker_key not in speakers:
+                speakers.append(speaker_key)
+        scope = ranked.key.parent()
+        counters = ndb.get_multi([
+            ConferenceApi._speakerCountKey(scope, speaker_key)
+            for speaker_key in speakers])
+
+        board = SpeakerLeaderboard(key=ranked.key, floor=ranked.floor)
+        for counter in counters:
+            if counter:
+                ConferenceApi._rankOnLeaderboard(board, counter.speaker,
+                                                 counter.count)
+        board.put()
+        return board
+
+    @staticmethod
+    def _backfillSpeakerSessionCounts():
+        """
+        Recount every speaker's sessions from scratch and rebuild all the
+        leaderboards. Only needed once for sessions created before the
+        counters existed.
+
+        NOTE: This method is being executed using taskqueue from
+        RebuildSpeakerCountsHandler() in main.py
+        """
+        counts = Counter()
+        names = {}
+        for session in Session.query():
+            if not session.websafeSpeakerKey:
+                continue
+            speaker_key = ndb.Key(urlsafe=session.websafeSpeakerKey)
+            counts[(None, speaker_key)] += 1
+            counts[(session.key.parent(), speaker_key)] += 1
+            names.setdefault((session.key.parent(), speaker_key),
+                             []).append(session.name)
+
+        ndb.put_multi([
+            SpeakerSessionCount(
+                key=ConferenceApi._speakerCountKey(scope, speaker_key),
+                speaker=speaker_key, conference=scope, count=count,
+                sessionNames=names.get((scope, speaker_key), []))
+            for (scope, speaker_key), count in counts.items()])
+
+        for scope in set(scope for scope, _ in counts):
+            ConferenceApi._rebuildSpeakerLeaderboard(scope)
+
+    @staticmethod
+    def _backfillSessionStartSlots():
+        """
+        Rewrite every session so that its startsBefore slots get stored.
+        Only needed once for sessions created before the slots existed.
+
+        NOTE: This method is being executed using taskqueue from
+        BackfillSessionStartSlotsHandler() in main.py
+        """
+        ConferenceApi._rewriteAll(Session)
+
+    @staticmethod
+    def _rewriteAll(model):
+        """Put every entity of model again, storing its computed
+        properties."""
+        cursor, more = None, True
+        while more:
+            entities, cursor, more = model.query().fetch_page(
+                POST_FILTER_BATCH_SIZE, start_cursor=cursor)
+            ndb.put_multi(entities)
+
     @endpoints.method(ConferenceSessionTypeStartTimeQueryForm, SessionForms,
                       path='session/bytype/bystarttime',
                       http_method='POST',
                       name='querySessionByTypeAndStartTime')
     def querySessionByTypeAndStartTime(self, request):
         """
-        querySessionByTypeAndStartTime solves the multiple inequality problem by
-        first retrieving the sessions filtered by typeOfSession requested by
-        client and then iterates through the results to check startTime which is
-        lesser than the provided startTime
-        Returns the resulting sessions in SessionForms
+        querySessionByTypeAndStartTime returns the sessions which are not of
+        the typeOfSession requested by client and start before the provided
+        startTime, optionally only those of one conference.
+
+        The datastore allows an inequality on one property only, so "starts
+        before" is turned into an equality on Session.startsBefore, the hour
+        slots before which a session starts. typeOfSession != X is run as
+        its two ranges (< X, then > X), one after the other, and the page
+        token tells which range to carry on with. Only sessions in the last
+        hour before startTime can be read and dropped. Sessions without a
+        startTime are included, as they were when the whole filter ran in
+        memory.
+        Returns a page of the resulting sessions in SessionForms
         """
-        sessions = Session.query()
-        # Filters session on typeOfSession
-        sessions = sessions.filter(Session.typeOfSession !=
-                                   request.typeOfSession)
-
-        # Checks if each session has startTime lower than the provided
-        # startTime
-        sessionsBeforeTime = [session for session in sessions
-                     if session.startTime < request.startTime]
-
-        # return individual SessionForm object per Session
+        if not request.typeOfSession or request.startTime is None:
+            raise endpoints.BadRequestException(
+                "'typeOfSession' and 'startTime' fields required")
+        fields = self._fieldMask(SessionForm, request.fields,
+                                 'websafeSessionKey')
+        page_size = self._pageSize(request)
+
+        # first hour slot at or after startTime
+        slot = min(-(-request.startTime // 100), 24)
+        if slot < 1:
+            return SessionForms()
+        ancestor = ndb.Key(urlsafe=request.websafeConferenceKey) \
+            if request.websafeConferenceKey else None
+        sessions = Session.query(Session.startsBefore == slot,
+                                 ancestor=ancestor)
+        ranges = [
+            sessions.filter(Session.typeOfSession < request.typeOfSession),
+            sessions.filter(Session.typeOfSession > request.typeOfSession),
+        ]
+
+        phase, _, token = (request.pageToken or '0:').partition(':')
+        if phase not in ('0', '1'):
+            raise endpoints.BadRequestException("Invalid 'pageToken'.")
+        cursor = self._startCursor(token)
+
+        results = []
+        nextPageToken = None
+        for phase in range(int(phase), len(ranges)):
+            if len(results) >= page_size:
+                nextPageToken = '%d:' % phase
+                break
+            page, next_cursor, more = ranges[phase].fetch_page(
+                page_size - len(results), start_cursor=cursor)
+            cursor = None
+            results += [session for session in page
+                        if session.startTime is None or
+                        session.startTime < request.startTime]
+            if more and next_cursor:
+                nextPageToken = '%d:%s' % (phase, next_cursor.urlsafe())
+                break
         return SessionForms(
-            sessions=[self._copySessionToForm(session)
-                      for session in sessionsBeforeTime]
+            sessions=[self._copySessionToForm(session, fields)
+                      for session in results],
+            nextPageToken=nextPageToken
         )
 
 # ---------------- Speaker Objects ------------ #
@@ -1010,36 +2172,18 @@ class ConferenceApi(remote.Service):
         del data['websafeSpeakerKey']
 
         # create Speaker & return (modified) SpeakerForm
-        speaker_key = Speaker(**data).put()
-        taskqueue.add(params={'email': user.email(),
-                              'speakerInfo': repr(request)},
-                      url='/tasks/send_speaker_confirmation_email'
-                      )
+        speaker = Speaker(**data)
+        speaker.put()
+        queueMail([mailTask('speaker', user.email(), [{
+            'name': speaker.name,
+            'organization': speaker.organization,
+            'interests': speaker.interests}])])
         # Return data as SpeakerForm
-        speakerform = SpeakerForm()
-
-        for field in speakerform.all_fields():
-            if data.has_key(field.name):
-                setattr(speakerform, field.name,
-                            data[field.name])
-            # Checks if the field is websafeSpeakerKey, then converts it into
-            # urlsafe key
-            elif field.name == "websafeSpeakerKey":
-                    setattr(speakerform, field.name, speaker_key.urlsafe())
-
-        speakerform.check_initialized()
-        return speakerform
+        return self._copySpeakerToForm(speaker)
 
     def _copySpeakerToForm(self, speaker):
         """Copy relevant fields from Speaker to SpeakerForm."""
-        speakerform = SpeakerForm()
-        for field in speakerform.all_fields():
-            if hasattr(speaker, field.name):
-                setattr(speakerform, field.name, getattr(speaker, field.name))
-            elif field.name == "websafeSpeakerKey":
-                setattr(speakerform, field.name, speaker.key.urlsafe())
-        speakerform.check_initialized()
-        return speakerform
+        return SPEAKER_TO_FORM(speaker)
 
     def _getSpeakers(self, request):
         """
@@ -1050,7 +2194,8 @@ class ConferenceApi(remote.Service):
         Same as conferences filters
         """
         q = Speaker.query()
-        inequality_filter, filters = self._formatFilters(request.filters)
+        inequality_filter, filters, post_filters = self._formatFilters(
+            request.filters)
 
         # If exists, sort on inequality filter first
         if not inequality_filter:
@@ -1063,7 +2208,94 @@ class ConferenceApi(remote.Service):
             formatted_query = ndb.query.FilterNode(
                 filtr["field"], filtr["operator"], filtr["value"])
             q = q.filter(formatted_query)
-        return q
+        return q, self._makePostFilter(post_filters)
+
+    def _searchSpeakers(self, request):
+        """
+        Finds the speakers having a word starting with each of the words of
+        request.query in their name, organization or interests, through
+        the Speaker.searchTokens index. At most SEARCH_CANDIDATE_LIMIT of
+        them are ranked, matches in the name first, then in the
+        organization, then in the interests, with whole words ahead of
+        beginnings of words. The ranked keys are cached for
+        SEARCH_CACHE_TTL seconds, so later pages only read their own
+        speakers. Returns (page of speakers, nextPageToken, truncated); the
+        page token is the offset of the next page in the ranking, and
+        truncated tells whether more than SEARCH_CANDIDATE_LIMIT speakers
+        matched the index, the others being left out.
+        """
+        terms = []
+        for term in tokenize(request.query):
+            if term not in terms:
+                terms.append(term)
+        terms = terms[:MAX_SEARCH_TERMS]
+        indexed = set(indexTerm(term) for term in terms
+                      if len(term) >= MIN_PREFIX_LENGTH)
+        if not indexed:
+            raise endpoints.BadRequestException(
+                "'query' must have a word of at least %d characters"
+                % MIN_PREFIX_LENGTH)
+
+        page_size = self._pageSize(request)
+        try:
+            offset = int(request.pageToken or 0)
+        except ValueError:
+            raise endpoints.BadRequestException("Invalid 'pageToken'.")
+
+        cache_key = MEMCACHE_SPEAKER_SEARCH_KEY % hashlib.md5(
+            u' '.join(terms).encode('utf-8')).hexdigest()
+        cached = memcache.get(cache_key)
+        if cached is not None:
+            ranked, truncated = cached
+            page = [speaker for speaker in ndb.get_multi(
+                [ndb.Key(urlsafe=wssk)
+                 for wssk in ranked[offset:offset + page_size]]) if speaker]
+        else:
+            ranked, truncated, speakers = self._rankSpeakerSearch(terms,
+                                                                  indexed)
+            memcache.set(cache_key, (ranked, truncated),
+                         time=SEARCH_CACHE_TTL)
+            page = speakers[offset:offset + page_size]
+
+        next_token = str(offset + page_size) \
+            if offset + page_size < len(ranked) else None
+        return page, next_token, truncated
+
+    def _rankSpeakerSearch(self, terms, indexed):
+        """Rank the speakers matching the indexed terms; returns (ranked
+        websafe keys, truncated, ranked Speakers). The candidates are found
+        with a keys-only query and read with one get_multi."""
+        q = Speaker.query(*[Speaker.searchTokens == term
+                            for term in sorted(indexed)])
+        keys = q.fetch(SEARCH_CANDIDATE_LIMIT + 1, keys_only=True)
+        truncated = len(keys) > SEARCH_CANDIDATE_LIMIT
+
+        ranked = []
+        for speaker in ndb.get_multi(keys[:SEARCH_CANDIDATE_LIMIT]):
+            if not speaker:
+                continue
+            rank = score(terms, [
+                (SEARCH_FIELD_WEIGHTS['name'], speaker.name),
+                (SEARCH_FIELD_WEIGHTS['organization'], speaker.organization)
+            ] + [(SEARCH_FIELD_WEIGHTS['interests'], interest)
+                 for interest in speaker.interests])
+            if rank:
+                ranked.append((-rank, speaker.name.lower(), speaker))
+        ranked.sort(key=lambda r: r[:2])
+        speakers = [speaker for _, _, speaker in ranked]
+        return ([speaker.key.urlsafe() for speaker in speakers], truncated,
+                speakers)
+
+    @staticmethod
+    def _backfillSpeakerSearchTokens():
+        """
+        Rewrite every speaker so that its searchTokens get stored. Only
+        needed once for speakers created before the search index existed.
+
+        NOTE: This method is being executed using taskqueue from
+        BackfillSpeakerSearchTokensHandler() in main.py
+        """
+        ConferenceApi._rewriteAll(Speaker)
 
     # endpoint for Creating Speaker
     @endpoints.method(SpeakerForm, SpeakerForm, path='speaker',
@@ -1081,33 +2313,55 @@ class ConferenceApi(remote.Service):
                       http_method='POST', name='querySpeakers')
     def querySpeakers(self, request):
         """
-        Queries Speakers, takes generic filters
-        Input: Field, Operator, Value
+        Queries Speakers, takes generic filters, one page at a time
+        Input: Field, Operator, Value, optional pageSize and pageToken
         """
-        speakers = self._getSpeakers(request)
+        q, post_filter = self._getSpeakers(request)
+        speakers, next_token = self._fetchPage(q, request, post_filter)
 
         # return individual SpeakerForm object
         return SpeakerForms(
             speakers=[self._copySpeakerToForm(speaker)
-                      for speaker in speakers]
+                      for speaker in speakers],
+            nextPageToken=next_token
+        )
+
+    # endpoint for searching speakers
+    @endpoints.method(SpeakerSearchForm, SpeakerForms,
+                      path='speakers/search',
+                      http_method='POST', name='searchSpeakers')
+    def searchSpeakers(self, request):
+        """
+        Searches Speakers by words or beginnings of words of their name,
+        organization and interests, best matches first
+        Input: query, optional pageSize and pageToken
+        """
+        speakers, next_token, truncated = self._searchSpeakers(request)
+        return SpeakerForms(
+            speakers=[self._copySpeakerToForm(speaker)
+                      for speaker in speakers],
+            nextPageToken=next_token,
+            truncated=truncated
         )
 
 
-    @ndb.transactional(xg=True)
+    def _wishlistEntryKey(self, user_id, session_key):
+        """Key of the WishlistEntry of a session in a user's wishlist."""
+        return ndb.Key(Profile, user_id, WishlistEntry, session_key.urlsafe())
+
     def _updateSessionWishlist(self, request, reg=True):
         """
-        It updates the wishlist attribute of the profile entity of user.
-        Stores the session keys
-        It adds the session in wishlist if the reg parameter is true, otherwise
-        removes the session from wishlist
-        This method is transactional so that in case of any failure, the partial
-        changes are reverted
+        Adds the session to the user's wishlist if the reg parameter is
+        true, otherwise removes it. Each session in a wishlist is a
+        WishlistEntry child of the user's Profile key, keyed by the session,
+        so adding and removing are a single put or delete of that key: they
+        are idempotent and need neither the Profile nor a transaction.
         """
-        retval = None
-        prof = self._getProfileFromUser()  # get user Profile
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
 
         # check if session exists given websafeSessionKey
-        # get session; check that it exists
         wssk = request.websafeSessionKey
         session_key = ndb.Key(urlsafe=wssk)
 
@@ -1117,36 +2371,54 @@ class ConferenceApi(remote.Service):
             raise endpoints.NotFoundException(
                 'wrong websafeSessionKey provided')
 
-        session = session_key.get()
-        if not session:
-            raise endpoints.NotFoundException(
-                'No conference found with key: %s' % wssk)
+        entry_key = self._wishlistEntryKey(getUserId(user), session_key)
 
         # add session to wishlist
         if reg:
-            # check if user already has the session in wishlist, otherwise add
-            if session_key in prof.sessionsWishList:
-                raise ConflictException(
-                    "This session is already in the wishlist")
-
-            # register user, take away one seat
-            prof.sessionsWishList.append(session_key)
-            retval = True
+            if not session_key.get():
+                raise endpoints.NotFoundException(
+                    'No session found with key: %s' % wssk)
+            WishlistEntry(key=entry_key).put()
 
         # remove session from wishlist
         else:
-            # check if session is already in wishlist
-            if session_key in prof.sessionsWishList:
+            entry_key.delete()
 
-                # remove session from wishlist
-                prof.sessionsWishList.remove(session_key)
-                retval = True
-            else:
-                retval = False
+        return BooleanMessage(data=True)
+
+    @staticmethod
+    def _migrateWishlists():
+        """
+        Move the sessions of the legacy Profile.sessionsWishList to
+        WishlistEntry entities. Only needed once for profiles from before
+        the wishlist entries existed.
 
-        # write things back to the datastore & return
-        prof.put()
-        return BooleanMessage(data=retval)
+        NOTE: This method is being executed using taskqueue from
+        MigrateWishlistsHandler() in main.py
+        """
+        cursor, more = None, True
+        while more:
+            profiles, cursor, more = Profile.query().fetch_page(
+                POST_FILTER_BATCH_SIZE, start_cursor=cursor)
+            for prof in profiles:
+                if prof.sessionsWishList:
+                    ConferenceApi._migrateWishlist(prof.key)
+
+    @staticmethod
+    @ndb.transactional
+    def _migrateWishlist(prof_key):
+        """Move one Profile's legacy wishlist to WishlistEntry entities. The
+        Profile is read again in the transaction, so registrations committed
+        since the query aren't overwritten."""
+        prof = prof_key.get()
+        if not prof or not prof.sessionsWishList:
+            return
+        entries = [WishlistEntry(key=ndb.Key(WishlistEntry,
+                                             session_key.urlsafe(),
+                                             parent=prof_key))
+                   for session_key in prof.sessionsWishList]
+        prof.sessionsWishList = []
+        ndb.put_multi([prof] + entries)
 
     @endpoints.method(SESSION_GET_REQUEST, BooleanMessage,
                       path='session/addtowishlist/{websafeSessionKey}',
@@ -1156,7 +2428,7 @@ class ConferenceApi(remote.Service):
         """
         endpoint for adding session to wishlist
         Input: Takes websafeSessionKey in querystring parameters
-        Returns: True/False based on operation completion
+        Returns: True once the session is in the wishlist
         """
         return self._updateSessionWishlist(request)
 
@@ -1168,30 +2440,141 @@ class ConferenceApi(remote.Service):
         """
         endpoint for deleting session from wishlist
         Input: Takes websafeSessionKey in querystring parameters
-        Returns: True/False based on operation completion
+        Returns: True once the session is not in the wishlist
         """
         return self._updateSessionWishlist(request, False)
 
-    @endpoints.method(message_types.VoidMessage, SessionForms,
+    @endpoints.method(PAGE_GET_REQUEST, SessionForms,
                       path='session/wishlist',
                       http_method='GET', name='getSessionsInWishlist')
     def getSessionsInWishlist(self, request):
         """
-        Get list of sessions that user has added to wishlist
+        Get list of sessions that user has added to wishlist, one page at a
+        time; the entries are read with a keys-only ancestor query and their
+        sessions with one get_multi
+        Input: optional pageSize and pageToken
         """
 
         user = endpoints.get_current_user()
         if not user:
             raise endpoints.UnauthorizedException('Authorization required')
 
-        # get user profile & make profile key
-        prof = self._getProfileFromUser()
+        q = WishlistEntry.query(ancestor=ndb.Key(Profile, getUserId(user)))
+        entry_keys, next_cursor, more = q.fetch_page(
+            self._pageSize(request),
+            start_cursor=self._startCursor(request.pageToken),
+            keys_only=True)
+        sessions = ndb.get_multi([ndb.Key(urlsafe=entry_key.id())
+                                  for entry_key in entry_keys])
+
+        # return set of SessionForm objects per Session, leaving out the
+        # sessions deleted since
+        return SessionForms(
+            sessions=[self._copySessionToForm(session)
+                      for session in sessions if session],
+            nextPageToken=next_cursor.urlsafe()
+            if more and next_cursor else None
+        )
+
+    @staticmethod
+    def _sessionSortKey(session):
+        """Sort key of sessions by date and startTime, undated ones last."""
+        return (session.date is None, session.date,
+                session.startTime is None, session.startTime)
 
-        # get sessionsWishList from profile.
-        sessions = ndb.get_multi(prof.sessionsWishList)
+    @staticmethod
+    def _sessionInterval(session):
+        """(start, end) datetimes of a session, None if its date or
+        startTime is not known."""
+        if session.date is None or session.startTime is None:
+            return None
+        start = datetime.combine(session.date, datetime.min.time()) + \
+            timedelta(hours=session.startTime // 100,
+                      minutes=session.startTime % 100)
+        return start, start + timedelta(minutes=session.duration or 0)
+
+    def _findOverlaps(self, sessions):
+        """
+        Returns {session key: [websafe keys of the sessions it overlaps]}
+        for the given sessions. Sessions are sorted by start and swept once,
+        keeping a heap of the ones still running; each session overlaps
+        those that end after it starts.
+        """
+        intervals = []
+        for session in sessions:
+            interval = self._sessionInterval(session)
+            if interval:
+                intervals.append((interval[0], interval[1], session.key))
+        intervals.sort()
+
+        overlaps = dict((key, []) for _, _, key in intervals)
+        running = []
+        for start, end, key in intervals:
+            while running and running[0][0] <= start:
+                heapq.heappop(running)
+            for _, other in running:
+                overlaps[key].append(other.urlsafe())
+                overlaps[other].append(key.urlsafe())
+            heapq.heappush(running, (end, key))
+        return overlaps
+
+    def _copyScheduleSessionToForm(self, session):
+        """SessionForm of a session of the schedule, with its conference."""
+        return SESSION_TO_FORM(
+            session, None,
+            websafeConferenceKey=session.key.parent().urlsafe())
+
+    @endpoints.method(message_types.VoidMessage, ScheduleForm,
+                      path='schedule',
+                      http_method='GET', name='getMySchedule')
+    def getMySchedule(self, request):
+        """
+        Get the user's schedule in one call: the conferences registered for,
+        all of their sessions, and the wishlist sessions sorted by date and
+        startTime with the ones that overlap each other flagged.
+        The conferences, the wishlist entries and the session keys of every
+        conference are read in parallel, with keys-only ancestor queries,
+        and all the sessions with one get_multi.
+        """
+        prof = self._getProfileFromUser()
 
-        # return set of SessionForm objects per Session
-        return SessionForms(sessions=[self._copySessionToForm(session)
-                                      for session in sessions])
+        conf_keys = [ndb.Key(urlsafe=wsck)
+                     for wsck in prof.conferenceKeysToAttend]
+        conf_futures = ndb.get_multi_async(conf_keys)
+        wishlist_future = WishlistEntry.query(ancestor=prof.key).fetch_async(
+            keys_only=True)
+        session_futures = [
+            Session.query(ancestor=conf_key).fetch_async(keys_only=True)
+            for conf_key in conf_keys]
+
+        conf_session_keys = [key for future in session_futures
+                             for key in future.get_result()]
+        wishlist_keys = [ndb.Key(urlsafe=entry_key.id())
+                         for entry_key in wishlist_future.get_result()]
+        # wishlist sessions of conferences attended are fetched only once
+        session_keys = list(set(conf_session_keys + wishlist_keys))
+        sessions = dict((key, session) for key, session in
+                        zip(session_keys, ndb.get_multi(session_keys))
+                        if session)
+
+        conf_sessions = sorted(
+            [sessions[key] for key in conf_session_keys if key in sessions],
+            key=self._sessionSortKey)
+        # leaving out the sessions deleted since they were added
+        wishlist = sorted(
+            [sessions[key] for key in wishlist_keys if key in sessions],
+            key=self._sessionSortKey)
+        overlaps = self._findOverlaps(wishlist)
+
+        return ScheduleForm(
+            conferences=self._copyConferencesToForms(
+                [future.get_result() for future in conf_futures]),
+            sessions=[self._copyScheduleSessionToForm(session)
+                      for session in conf_sessions],
+            wishlist=[ScheduleSessionForm(
+                session=self._copyScheduleSessionToForm(session),
+                overlapsWith=overlaps.get(session.key, []))
+                for session in wishlist]
+        )
 
-api = endpoints.api_server([ConferenceApi])
+api = InstrumentedApplication(endpoints.api_server([ConferenceApi]))
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""
+converters.py -- precompiled copies of datastore entities into their
+    ProtoRPC form messages.
+
+register() works out once, at import time, how each field of a form is
+read from its model: plain copy, date to string, string to enum, key to
+websafe key, or the entity's own websafe key. It returns a copy function
+that only runs those steps, so list endpoints don't pay for all_fields(),
+hasattr() and name checks on every field of every entity.
+reflectiveCopy() is the field by field copy that the endpoints used
+before, kept as a reference for benchmark_converters.py.
+
+$Id: converters.py
+
+Author: Zeeshan Ahmad
+Email: ahmad.zeeshaan@gmail.com
+
+"""
+
+import operator
+
+from protorpc import messages
+from google.appengine.ext import ndb
+
+from models import Conference
+from models import ConferenceForm
+from models import Profile
+from models import ProfileForm
+from models import Session
+from models import SessionForm
+from models import Speaker
+from models import SpeakerForm
+
+__author__ = 'ahmad.zeeshan@gmail.com (Zeeshan Ahmad)'
+
+_converters = {}
+
+
+def _getter(prop, field):
+    """Return a function reading the value of field from an entity."""
+    name = prop._code_name
+    if isinstance(prop, ndb.DateTimeProperty):
+        # convert Date to date string
+        return lambda entity: str(getattr(entity, name))
+    if isinstance(field, messages.EnumField):
+        # convert string to Enum
+        enum = field.type
+        return lambda entity: getattr(enum, getattr(entity, name))
+    if isinstance(prop, ndb.KeyProperty):
+        if prop._repeated:
+            return lambda entity: [key.urlsafe()
+                                   for key in getattr(entity, name)]
+        return lambda entity: getattr(entity, name) and \
+            getattr(entity, name).urlsafe()
+    return operator.attrgetter(name)
+
+
+def register(model_class, form_class, key_field=None):
+    """Build the copy function of model_class entities into form_class
+    messages and return it.
+
+    The copy function takes an entity, optionally the set of the names of
+    the fields to copy (all if None), and values of fields that don't come
+    from the entity as keyword arguments. Fields of form_class that are
+    neither properties of model_class nor key_field are left unset.
+    """
+    steps = []
+    for field in form_class.all_fields():
+        prop = model_class._properties.get(field.name)
+        if prop is not None:
+            steps.append((field.name, _getter(prop, field)))
+        elif field.name == key_field:
+            steps.append((field.name, lambda entity: entity.key.urlsafe()))
+    steps = tuple(steps)
+
+    def copy(entity, fields=None, **extra):
+        if fields is None:
+            values = dict((name, get(entity)) for name, get in steps)
+        else:
+            values = dict((name, get(entity)) for name, get in steps
+                          if name in fields)
+        values.update(extra)
+        return form_class(**values)
+
+    _converters[(model_class, form_class)] = copy
+    return copy
+
+
+def converter(model_class, form_class):
+    """Return the registered copy function of model_class into
+    form_class."""
+    return _converters[(model_class, form_class)]
+
+
+def reflectiveCopy(entity, form_class, key_field=None, fields=None,
+                   **extra):
+    """Copy entity into a form_class message looking every field up as it
+    goes; same result as the registered copy functions, only slower."""
+    form = form_class()
+    for field in form.all_fields():
+        if fields is not None and field.name not in fields:
+            continue
+        if field.name in extra:
+            setattr(form, field.name, extra[field.name])
+        elif hasattr(entity, field.name):
+            value = getattr(entity, field.name)
+            # convert Date to date string, string to Enum, keys to websafe
+            # keys; just copy others
+            if field.name.lower().endswith('date'):
+                value = str(value)
+            elif isinstance(field, messages.EnumField):
+                value = getattr(field.type, value)
+            elif isinstance(value, ndb.Key):
+                value = value.urlsafe()
+            elif isinstance(value, list) and value and \
+                    isinstance(value[0], ndb.Key):
+                value = [key.urlsafe() for key in value]
+            setattr(form, field.name, value)
+        elif field.name == key_field:
+            setattr(form, field.name, entity.key.urlsafe())
+    form.check_initialized()
+    return form
+
+
+register(Conference, ConferenceForm, 'websafeKey')
+register(Session, SessionForm, 'websafeSessionKey')
+register(Speaker, SpeakerForm, 'websafeSpeakerKey')
+register(Profile, ProfileForm)
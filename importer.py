@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+"""
+importer.py -- streaming bulk import of conferences, speakers and sessions
+    from an uploaded JSONL or CSV file.
+
+Every line of the file is one record whose "kind" is conference, speaker or
+session; the other fields are those of ConferenceForm, SpeakerForm and
+SessionForm. A session names its conference and speaker in its "conference"
+and "speaker" fields, so those must come earlier in the file or exist
+already (conferences are looked up among the organizer's). In CSV files the
+first record holds the field names and the values of topics, interests and
+highlights are separated by ';'; quoted values may span lines.
+
+The file is read from the blobstore a record at a time and written with
+put_multi in batches of ImportJob.batchSize records. After each batch the
+position of the next record is saved on the ImportJob, so an interrupted
+import resumes from there. Conferences and sessions get IDs made of the job
+and line they come from, speakers of the job and their name, and existing
+ones are skipped, so replaying a batch after a crash doesn't import it
+twice. Speakers of the job are found again by that ID in later batches,
+without relying on an eventually consistent query.
+
+$Id: importer.py
+
+Author: Zeeshan Ahmad
+Email: ahmad.zeeshaan@gmail.com
+
+"""
+
+import csv
+import hashlib
+from itertools import islice
+import json
+import time
+
+from protorpc import messages
+
+from google.appengine.api import taskqueue
+from google.appengine.ext import blobstore
+from google.appengine.ext import ndb
+
+from conference import ConferenceApi
+from models import Conference
+from models import ConferenceForm
+from models import ImportJob
+from models import Profile
+from models import Session
+from models import SessionForm
+from models import Speaker
+from models import TeeShirtSize
+
+__author__ = 'ahmad.zeeshan@gmail.com (Zeeshan Ahmad)'
+
+IMPORT_BATCH_SIZE = 100
+MAX_IMPORT_BATCH_SIZE = 500
+
+# seconds an import task runs before handing over to a new task
+IMPORT_TIME_BUDGET = 8 * 60
+
+# only the first errors are kept on the ImportJob
+MAX_IMPORT_ERRORS = 100
+
+LIST_FIELDS = ('topics', 'interests', 'highlights')
+INT_FIELDS = ('maxAttendees', 'duration', 'startTime')
+LIST_SEPARATOR = ';'
+
+# at most this many values per IN filter, tasks per Queue.add() call
+MAX_IN_VALUES = 30
+MAX_TASKS_PER_ADD = 100
+
+
+def startImport(blob_key, file_name, organizer_email, batch_size=None):
+    """Create an ImportJob for an uploaded file and start importing it.
+    Imported conferences are organized by the given user, whose Profile is
+    created if needed."""
+    p_key = ndb.Key(Profile, organizer_email)
+    if not p_key.get():
+        Profile(key=p_key,
+                displayName=organizer_email,
+                mainEmail=organizer_email,
+                teeShirtSize=str(TeeShirtSize.NOT_SPECIFIED)).put()
+
+    job = ImportJob(
+        blobKey=blob_key,
+        fileName=file_name,
+        format='csv' if file_name.lower().endswith('.csv') else 'jsonl',
+        organizerUserId=organizer_email,
+        batchSize=min(batch_size or IMPORT_BATCH_SIZE,
+                      MAX_IMPORT_BATCH_SIZE))
+    job.put()
+    _enqueue(job.key)
+    return job
+
+
+def _enqueue(job_key):
+    taskqueue.add(params={'jobId': job_key.id()}, url='/tasks/import')
+
+
+def runImport(job_id):
+    """Import the next batches of a job, until the file is done or the time
+    budget is spent, in which case a task is enqueued to carry on.
+
+    NOTE: This method is being executed using taskqueue from
+    ImportTaskHandler() in main.py
+    """
+    job = ImportJob.get_by_id(int(job_id))
+    if not job or job.status != 'running':
+        return
+
+    deadline = time.time() + IMPORT_TIME_BUDGET
+    reader = blobstore.BlobReader(job.blobKey, buffer_size=1 << 20,
+                                  position=job.position)
+    records = _readRecords(reader, job)
+    if job.format == 'csv' and not job.csvHeader:
+        _, header = next(records, (None, []))
+        job.csvHeader = [name.strip() for name in header]
+        job.position = reader.tell()
+
+    importer = _Importer(job)
+    while True:
+        batch = list(islice(records, job.batchSize))
+        eof = len(batch) < job.batchSize
+        importer.importBatch(batch)
+
+        # checkpoint
+        job.position = reader.tell()
+        if eof:
+            job.status = 'done'
+        job.put()
+
+        if eof:
+            return
+        if time.time() > deadline:
+            _enqueue(job.key)
+            return
+
+
+def _readRecords(reader, job):
+    """Yield (line number, record) for the non-blank records after the
+    reader's position: lists of values read with csv.reader for CSV files,
+    so that quoted values may span lines, lines of text for JSONL files.
+    job.line is kept at the last line read, and reader.tell() is the
+    position of the next record whenever a record has been yielded."""
+    lines = iter(reader.readline, '')
+    if job.format == 'csv':
+        first = job.line
+        rows = csv.reader(lines)
+        for values in rows:
+            line = job.line + 1
+            job.line = first + rows.line_num
+            if any(value.strip() for value in values):
+                yield line, values
+    else:
+        for text in lines:
+            job.line += 1
+            if text.strip():
+                yield job.line, text
+
+
+def _parse(job, data):
+    """Turn the values of a CSV record or a JSONL line into a record
+    dict."""
+    if job.format == 'csv':
+        record = dict((name, value.decode('utf-8').strip())
+                      for name, value in zip(job.csvHeader, data)
+                      if value.strip())
+    else:
+        record = json.loads(data)
+        if not isinstance(record, dict):
+            raise ValueError('not a JSON object')
+
+    for field in LIST_FIELDS:
+        if isinstance(record.get(field), basestring):
+            record[field] = [value.strip() for value in
+                             record[field].split(LIST_SEPARATOR)
+                             if value.strip()]
+    for field in INT_FIELDS:
+        if record.get(field) not in (None, ''):
+            record[field] = int(record[field])
+    if record.get('kind') not in ('conference', 'speaker', 'session'):
+        raise ValueError('unknown kind: %s' % record.get('kind'))
+    return record
+
+
+class _Importer(object):
+    """Writes batches of records for one ImportJob."""
+
+    def __init__(self, job):
+        self.job = job
+        self.api = ConferenceApi()
+        self.p_key = ndb.Key(Profile, job.organizerUserId)
+        # name -> key of the organizer's conferences, name -> Speaker
+        self.conferences = {}
+        self.speakers = {}
+
+    def _id(self, line):
+        return 'import-%d-%d' % (self.job.key.id(), line)
+
+    def _speakerKey(self, name):
+        """Key of the Speaker this job creates for a name."""
+        digest = hashlib.sha1(unicode(name).encode('utf-8')).hexdigest()
+        return ndb.Key(Speaker, 'import-%d-speaker-%s' % (self.job.key.id(),
+                                                          digest))
+
+    def _fail(self, line, error):
+        self.job.failed += 1
+        if len(self.job.errors) < MAX_IMPORT_ERRORS:
+            self.job.errors.append('line %d: %s' % (line, error))
+
+    def importBatch(self, lines):
+        records = []
+        for line, data in lines:
+            try:
+                records.append((line, _parse(self.job, data)))
+            except ValueError as e:
+                self._fail(line, e)
+
+        # conferences & speakers first, as sessions of the same batch may
+        # refer to them
+        self._importConferencesAndSpeakers(
+            [(line, record) for line, record in records
+             if record['kind'] != 'session'])
+        self._importSessions(
+            [(line, record) for line, record in records
+             if record['kind'] == 'session'])
+
+    def _putNew(self, entities_by_key):
+        """put_multi the entities whose key doesn't exist yet; returns the
+        keys that were written."""
+        keys = entities_by_key.keys()
+        new = [key for key, entity in zip(keys, ndb.get_multi(keys))
+               if not entity]
+        self.job.created += len(new)
+        self.job.skipped += len(keys) - len(new)
+        ndb.put_multi([entity for key in new
+                       for entity in entities_by_key[key]])
+        return new
+
+    def _importConferencesAndSpeakers(self, records):
+        entities = {}
+        for line, record in records:
+            if not record.get('name'):
+                self._fail(line, "'name' field required")
+                continue
+            try:
+                if record['kind'] == 'conference':
+                    form = ConferenceForm(**dict(
+                        (field.name, record.get(field.name))
+                        for field in ConferenceForm.all_fields()
+                        if record.get(field.name) is not None))
+                    data = self.api._conferenceData(form)
+                    data['organizerUserId'] = self.job.organizerUserId
+                    key = ndb.Key(Conference, self._id(line),
+                                  parent=self.p_key)
+                    entities[key] = self.api._makeConference(key, data)
+                    self.conferences[record['name']] = key
+                else:
+                    speaker = Speaker(
+                        key=self._speakerKey(record['name']),
+                        name=record['name'],
+                        organization=record.get('organization'),
+                        interests=record.get('interests') or [])
+                    entities[speaker.key] = [speaker]
+                    self.speakers[record['name']] = speaker
+            except (TypeError, ValueError, messages.ValidationError) as e:
+                self._fail(line, e)
+        self._putNew(entities)
+
+    def _lookup(self, model, names, found, ancestor=None):
+        """Look up by name the entities not found yet."""
+        names = [name for name in set(names) if name not in found]
+        for i in range(0, len(names), MAX_IN_VALUES):
+            q = model.query(model.name.IN(names[i:i + MAX_IN_VALUES]),
+                            ancestor=ancestor)
+            for entity in q:
+                found.setdefault(entity.name, entity)
+
+    def _lookupSpeakers(self, names):
+        """Look up the speakers not found yet: those of this job by key,
+        created by earlier tasks too, others by name."""
+        names = [name for name in set(names)
+                 if name and name not in self.speakers]
+        for name, speaker in zip(names, ndb.get_multi(
+                [self._speakerKey(name) for name in names])):
+            if speaker:
+                self.speakers[name] = speaker
+        self._lookup(Speaker, names, self.speakers)
+
+    def _importSessions(self, records):
+        self._lookupSpeakers([r.get('speaker') for _, r in records])
+        conferences = {}
+        self._lookup(Conference, [r.get('conference') for _, r in records
+                                  if r.get('conference') not in
+                                  self.conferences],
+                     conferences, ancestor=self.p_key)
+        for name, conf in conferences.items():
+            self.conferences[name] = conf.key
+
+        sessions = {}
+        for line, record in records:
+            conf_key = self.conferences.get(record.get('conference'))
+            speaker = self.speakers.get(record.get('speaker'))
+            if not record.get('name'):
+                self._fail(line, "'name' field required")
+            elif not conf_key:
+                self._fail(line, 'unknown conference: %s' %
+                           record.get('conference'))
+            elif not speaker:
+                self._fail(line, 'unknown speaker: %s' %
+                           record.get('speaker'))
+            else:
+                try:
+                    form = SessionForm(**dict(
+                        (field.name, record.get(field.name))
+                        for field in SessionForm.all_fields()
+                        if record.get(field.name) is not None))
+                    form.websafeSpeakerKey = speaker.key.urlsafe()
+                    data = self.api._sessionData(form)
+                except (TypeError, ValueError,
+                        messages.ValidationError) as e:
+                    self._fail(line, e)
+                    continue
+                data['key'] = ndb.Key(Session, self._id(line),
+                                      parent=conf_key)
+                sessions[data['key']] = (Session(**data), speaker)
+        if not sessions:
+            return
+
+        keys = sessions.keys()
+        new = [key for key, entity in zip(keys, ndb.get_multi(keys))
+               if not entity]
+        self.job.created += len(new)
+        self.job.skipped += len(keys) - len(new)
+
+        # sessions of one conference are written together with their
+        # speakers' session counters
+        groups = {}
+        for key in new:
+            groups.setdefault(key.parent(), []).append(sessions[key])
+        featured = {}
+        for conf_key, group in groups.items():
+            for batch in self.api._sessionBatches(
+                    [session for session, _ in group]):
+                self.api._putSessions(batch)
+            featured[conf_key] = [speaker for _, speaker in group]
+
+        tasks = [self.api._featuredSpeakerTask(conf_key.urlsafe(), speakers)
+                 for conf_key, speakers in featured.items()]
+        for i in range(0, len(tasks), MAX_TASKS_PER_ADD):
+            taskqueue.Queue().add(tasks[i:i + MAX_TASKS_PER_ADD])
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+"""
+instrumentation.py -- records the cost of every request served by the
+    Conference API and the task/cron handlers: wall time, datastore gets,
+    puts and queries, memcache hits and misses and task enqueues.
+
+Counts come from an App Engine API post-call hook and are kept per thread
+for the request being served. Totals per endpoint are accumulated on the
+instance and added to memcache counters every FLUSH_INTERVAL seconds, so
+they cover all instances; InstrumentationHandler in main.py serves them.
+
+$Id: instrumentation.py
+
+Author: Zeeshan Ahmad
+Email: ahmad.zeeshaan@gmail.com
+
+"""
+
+import json
+import logging
+import threading
+import time
+
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.api import memcache
+
+from settings import INSTRUMENTATION_LOG_REQUESTS
+
+__author__ = 'ahmad.zeeshan@gmail.com (Zeeshan Ahmad)'
+
+METRICS = ('calls', 'ms', 'datastore_gets', 'datastore_puts',
+           'datastore_queries', 'memcache_hits', 'memcache_misses', 'tasks')
+
+MEMCACHE_INSTRUMENTATION_KEY = 'MEMCACHE_INSTRUMENTATION_KEY:%s:%s'
+
+# seconds between two flushes of an instance's totals to memcache
+FLUSH_INTERVAL = 10
+
+_current = threading.local()
+_lock = threading.Lock()
+_totals = {}
+_last_flush = [time.time()]
+
+
+def _count(service, call, request, response):
+    """API post-call hook adding the call to the current request's stats."""
+    stats = getattr(_current, 'stats', None)
+    if stats is None:
+        return
+    if service == 'datastore_v3':
+        if call == 'Get':
+            stats['datastore_gets'] += 1
+        elif call == 'Put':
+            stats['datastore_puts'] += 1
+        elif call == 'RunQuery':
+            stats['datastore_queries'] += 1
+    elif service == 'memcache' and call == 'Get':
+        hits = response.item_size()
+        stats['memcache_hits'] += hits
+        stats['memcache_misses'] += request.key_size() - hits
+    elif service == 'taskqueue' and call == 'BulkAdd':
+        stats['tasks'] += request.add_request_size()
+
+
+apiproxy_stub_map.apiproxy.GetPostCallHooks().Append(
+    'conference-instrumentation', _count)
+
+
+def _requestName(environ):
+    """Name requests by endpoint method or by handler path."""
+    path = environ.get('PATH_INFO', '')
+    if path.startswith('/_ah/spi/'):
+        return path[len('/_ah/spi/'):]
+    return path
+
+
+def _start():
+    stats = dict((metric, 0) for metric in METRICS)
+    _current.stats = stats
+    return stats
+
+
+def _finish(name, stats, start):
+    _current.stats = None
+    stats['calls'] = 1
+    stats['ms'] = int((time.time() - start) * 1000)
+
+    if INSTRUMENTATION_LOG_REQUESTS:
+        logging.info('instrumentation %s',
+                     json.dumps(dict(stats, endpoint=name), sort_keys=True))
+
+    with _lock:
+        totals = _totals.setdefault(name,
+                                    dict((metric, 0) for metric in METRICS))
+        for metric in METRICS:
+            totals[metric] += stats[metric]
+        due = time.time() - _last_flush[0] >= FLUSH_INTERVAL
+    if due:
+        flush()
+
+
+def flush():
+    """Add this instance's totals to the memcache counters."""
+    with _lock:
+        pending = dict(_totals)
+        _totals.clear()
+        _last_flush[0] = time.time()
+    offsets = {}
+    for name, totals in pending.items():
+        for metric, value in totals.items():
+            if value:
+                offsets[MEMCACHE_INSTRUMENTATION_KEY % (name, metric)] = value
+    if offsets:
+        memcache.offset_multi(offsets, initial_value=0)
+
+
+def getAggregates(names):
+    """Return {name: {metric: total, 'avg_ms': ...}} from memcache for the
+    given endpoint names, leaving out those never called."""
+    flush()
+    keys = [MEMCACHE_INSTRUMENTATION_KEY % (name, metric)
+            for name in names for metric in METRICS]
+    values = memcache.get_multi(keys)
+
+    aggregates = {}
+    for name in names:
+        totals = dict((metric, int(values.get(
+            MEMCACHE_INSTRUMENTATION_KEY % (name, metric), 0)))
+            for metric in METRICS)
+        if totals['calls']:
+            totals['avg_ms'] = totals['ms'] / float(totals['calls'])
+            aggregates[name] = totals
+    return aggregates
+
+
+class InstrumentedApplication(object):
+    """WSGI middleware recording the cost of each request to app."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        name = _requestName(environ)
+        stats = _start()
+        start = time.time()
+        try:
+            return self.app(environ, start_response)
+        finally:
+            _finish(name, stats, start)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+"""
+mailer.py -- confirmation emails, sent in batches from a pull queue.
+
+Endpoints queue one pull task per email with mailTask() and queueMail(): the
+name of a template and the structured fields of the items (conference,
+sessions, speaker) it is about. SendMailHandler in main.py, run by cron,
+calls sendQueuedMail(), which leases the tasks MAIL_BATCH_SIZE at a time,
+renders them and hands them to a transport: the App Engine mail API, or an
+SMTP server such as a local `python -m smtpd -n -c DebuggingServer
+localhost:1025` for tests (see MAIL_TRANSPORT in settings.py). Emails that
+fail are retried with exponential backoff by delaying their lease.
+
+$Id: mailer.py
+
+Author: Zeeshan Ahmad
+Email: ahmad.zeeshaan@gmail.com
+
+"""
+
+from collections import namedtuple
+from email.mime.text import MIMEText
+import json
+import logging
+import smtplib
+import time
+
+from google.appengine.api import app_identity
+from google.appengine.api import mail
+from google.appengine.api import taskqueue
+
+from settings import MAIL_SMTP_HOST
+from settings import MAIL_SMTP_PORT
+from settings import MAIL_TRANSPORT
+
+__author__ = 'ahmad.zeeshan@gmail.com (Zeeshan Ahmad)'
+
+MAIL_QUEUE = 'mail'
+
+# tasks leased at a time, for how long, and how long a run may go on
+MAIL_BATCH_SIZE = 100
+MAIL_LEASE_SECONDS = 60
+MAIL_WORKER_BUDGET = 50
+
+# a failed email is retried after MAIL_RETRY_DELAY seconds, doubling every
+# time up to MAX_MAIL_RETRY_DELAY, and dropped after MAX_MAIL_RETRIES
+MAIL_RETRY_DELAY = 30
+MAX_MAIL_RETRY_DELAY = 3600
+MAX_MAIL_RETRIES = 8
+
+# at most this many tasks per Queue.add() call
+MAX_TASKS_PER_ADD = 100
+
+# template name: (subject, greeting, body of each item)
+MAIL_TEMPLATES = {
+    'conference': (
+        'You created a new Conference!',
+        'Hi, you have created the following conference:',
+        'Name: {name}\r\n'
+        'Description: {description}\r\n'
+        'City: {city}\r\n'
+        'Dates: {startDate} - {endDate}\r\n'
+        'Topics: {topics}\r\n'
+        'Maximum attendees: {maxAttendees}'),
+    'session': (
+        'You created a new Session!',
+        'Hi, you have created the following session(s):',
+        'Name: {name}\r\n'
+        'Conference: {conference}\r\n'
+        'Speaker: {speaker}\r\n'
+        'Type: {typeOfSession}\r\n'
+        'Date: {date} at {startTime}, {duration} minutes\r\n'
+        'Highlights: {highlights}'),
+    'speaker': (
+        'You added a new Speaker!',
+        'Hi, you have added the following speaker:',
+        'Name: {name}\r\n'
+        'Organization: {organization}\r\n'
+        'Interests: {interests}'),
+}
+
+Email = namedtuple('Email', ['sender', 'to', 'subject', 'body'])
+
+
+def mailTask(template, to, items):
+    """Pull task of an email to send; items are dicts of the fields the
+    template shows, one per conference, session or speaker."""
+    if template not in MAIL_TEMPLATES:
+        raise ValueError('unknown mail template: %s' % template)
+    return taskqueue.Task(method='PULL', payload=json.dumps({
+        'template': template, 'to': to, 'items': items}))
+
+
+def queueMailAsync(tasks):
+    """Start adding mail tasks to the mail queue, MAX_TASKS_PER_ADD per
+    call; returns the RPCs to wait on."""
+    queue = taskqueue.Queue(MAIL_QUEUE)
+    return [queue.add_async(tasks[i:i + MAX_TASKS_PER_ADD])
+            for i in range(0, len(tasks), MAX_TASKS_PER_ADD)]
+
+
+def queueMail(tasks):
+    """Add mail tasks to the mail queue, MAX_TASKS_PER_ADD per call."""
+    for rpc in queueMailAsync(tasks):
+        rpc.get_result()
+
+
+def _show(value):
+    """Format a field value for an email body."""
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return ', '.join(unicode(v) for v in value)
+    return unicode(value)
+
+
+def render(payload, sender):
+    """Turn the payload of a mail task into an Email."""
+    message = json.loads(payload)
+    subject, greeting, item = MAIL_TEMPLATES[message['template']]
+    body = '\r\n\r\n'.join(
+        [greeting] +
+        [item.format(**dict((name, _show(value))
+                            for name, value in fields.items()))
+         for fields in message['items']])
+    return Email(sender, message['to'], subject, body)
+
+
+class AppEngineTransport(object):
+    """Sends emails with the App Engine mail API."""
+
+    def send(self, email):
+        mail.send_mail(email.sender, email.to, email.subject, email.body)
+
+    def close(self):
+        pass
+
+
+class SmtpTransport(object):
+    """Sends emails to an SMTP server, over one connection per run."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.connection = None
+
+    def send(self, email):
+        if not self.connection:
+            self.connection = smtplib.SMTP(self.host, self.port)
+        message = MIMEText(email.body.encode('utf-8'), 'plain', 'utf-8')
+        message['From'] = email.sender
+        message['To'] = email.to
+        message['Subject'] = email.subject
+        try:
+            self.connection.sendmail(email.sender, [email.to],
+                                     message.as_string())
+        except smtplib.SMTPServerDisconnected:
+            self.connection = None
+            raise
+
+    def close(self):
+        if self.connection:
+            self.connection.quit()
+            self.connection = None
+
+
+def getTransport():
+    """The transport selected by MAIL_TRANSPORT in settings.py."""
+    if MAIL_TRANSPORT == 'smtp':
+        return SmtpTransport(MAIL_SMTP_HOST, MAIL_SMTP_PORT)
+    return AppEngineTransport()
+
+
+def sendQueuedMail(transport=None, budget=MAIL_WORKER_BUDGET):
+    """Send the queued emails, a batch at a time, until the queue is empty
+    or budget seconds have passed. Returns the number of emails sent.
+
+    NOTE: This method is being executed by cron from SendMailHandler() in
+    main.py
+    """
+    queue = taskqueue.Queue(MAIL_QUEUE)
+    transport = transport or getTransport()
+    sender = 'noreply@%s.appspotmail.com' % (
+        app_identity.get_application_id())
+    deadline = time.time() + budget
+    sent = 0
+    try:
+        while time.time() < deadline:
+            tasks = queue.lease_tasks(MAIL_LEASE_SECONDS, MAIL_BATCH_SIZE)
+            if not tasks:
+                break
+            done = []
+            for task in tasks:
+                try:
+                    email = render(task.payload, sender)
+                except (KeyError, ValueError):
+                    logging.exception('Dropping malformed mail task %s',
+                                      task.name)
+                    done.append(task)
+                    continue
+                try:
+                    transport.send(email)
+                except Exception:
+                    if task.retry_count >= MAX_MAIL_RETRIES:
+                        logging.exception('Giving up on mail to %s',
+                                          email.to)
+                        done.append(task)
+                    else:
+                        logging.warning('Could not send mail to %s, retrying',
+                                        email.to, exc_info=True)
+                        queue.modify_task_lease(task, min(
+                            MAIL_RETRY_DELAY * 2 ** task.retry_count,
+                            MAX_MAIL_RETRY_DELAY))
+                    continue
+                sent += 1
+                done.append(task)
+            if done:
+                queue.delete_tasks(done)
+    finally:
+        transport.close()
+    return sent
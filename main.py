@@ -1,12 +1,35 @@
 #!/usr/bin/env python
+import cgi
+import json
+import urllib
+
 import webapp2
 from google.appengine.api import app_identity
 from google.appengine.api import mail
+from google.appengine.ext import blobstore
+from google.appengine.ext import ndb
+from google.appengine.ext.webapp import blobstore_handlers
 from conference import ConferenceApi
+from mailer import sendQueuedMail
+from importer import runImport
+from importer import startImport
+from models import ImportJob
+from instrumentation import InstrumentedApplication
+from instrumentation import getAggregates
 
 from google.appengine.api import app_identity
 from google.appengine.api import mail
 
+# Sends the confirmation emails queued in the mail pull queue
+class SendMailHandler(webapp2.RequestHandler):
+
+    def get(self):
+        """Send queued emails in batches."""
+        sendQueuedMail()
+
+# The three handlers below send the confirmation emails of push tasks
+# queued before the mail queue existed; they can go once those are done.
+
 # Sends confirmation email for Conference addition
 
 
@@ -63,8 +86,43 @@ class SetFeaturedSpeakerHandler(webapp2.RequestHandler):
     def post(self):
         ConferenceApi._setFeaturedSpeaker(self,
         self.request.get('websafeConferenceKey'),
-        self.request.get('websafeSpeakerKey'),
-        self.request.get('speaker'))
+        self.request.get_all('websafeSpeakerKey'),
+        self.request.get_all('speaker'))
+
+# Recounts sessions per speaker for sessions created before the counters
+class RebuildSpeakerCountsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Rebuild speaker session counters and leaderboards."""
+        ConferenceApi._backfillSpeakerSessionCounts()
+
+# Rebuilds a speaker leaderboard from the session counters
+class RebuildSpeakerLeaderboardHandler(webapp2.RequestHandler):
+    def post(self):
+        """Rebuild the leaderboard of a conference, or across all."""
+        websafeConferenceKey = self.request.get('websafeConferenceKey')
+        ConferenceApi._rebuildSpeakerLeaderboard(
+            ndb.Key(urlsafe=websafeConferenceKey)
+            if websafeConferenceKey else None)
+
+class BackfillSessionStartSlotsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Store the startsBefore slots of existing sessions."""
+        ConferenceApi._backfillSessionStartSlots()
+
+class BackfillSpeakerSearchTokensHandler(webapp2.RequestHandler):
+    def post(self):
+        """Store the search tokens of existing speakers."""
+        ConferenceApi._backfillSpeakerSearchTokens()
+
+class MigrateWishlistsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Move profile wishlists to WishlistEntry entities."""
+        ConferenceApi._migrateWishlists()
+
+class BackfillRegistrationsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Write Registration entities of existing registrations."""
+        ConferenceApi._backfillRegistrations()
 
 class SetAnnouncementHandler(webapp2.RequestHandler):
 
@@ -74,8 +132,82 @@ class SetAnnouncementHandler(webapp2.RequestHandler):
         # use _cacheAnnouncement() to set announcement in Memcache
         ConferenceApi._cacheAnnouncement()
 
-app = webapp2.WSGIApplication([
+# Returns the per-endpoint datastore/memcache/task counts and timings
+class InstrumentationHandler(webapp2.RequestHandler):
+
+    def get(self):
+        """Serve instrumentation aggregates as JSON."""
+        names = ['ConferenceApi.%s' % name
+                 for name in ConferenceApi.all_remote_methods()]
+        names += [route[0] for route in ROUTES]
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(getAggregates(names), indent=2,
+                                       sort_keys=True))
+
+# Upload form and progress of the bulk imports
+class ImportHandler(webapp2.RequestHandler):
+
+    def get(self):
+        """Show the import upload form and the latest import jobs."""
+        error = self.request.get('error')
+        if error:
+            self.response.write('<p><b>%s</b></p>' % cgi.escape(error))
+        self.response.write(
+            '<h3>Import conferences, speakers and sessions</h3>'
+            '<form action="%s" method="POST" enctype="multipart/form-data">'
+            'JSONL or CSV file: <input type="file" name="file"><br>'
+            'Organizer email: <input type="text" name="organizer"><br>'
+            'Batch size: <input type="text" name="batchSize"><br>'
+            '<input type="submit" value="Import"></form>'
+            % blobstore.create_upload_url('/admin/import/upload'))
+
+        self.response.write('<h3>Imports</h3><table><tr><th>File</th>'
+                            '<th>Status</th><th>Lines</th><th>Created</th>'
+                            '<th>Skipped</th><th>Failed</th><th>Errors</th>'
+                            '</tr>')
+        for job in ImportJob.query().order(-ImportJob.started).fetch(20):
+            self.response.write(
+                '<tr><td>%s</td><td>%s</td><td>%d</td><td>%d</td><td>%d</td>'
+                '<td>%d</td><td>%s</td></tr>' % (
+                    cgi.escape(job.fileName or ''), job.status, job.line,
+                    job.created, job.skipped, job.failed,
+                    '<br>'.join(cgi.escape(e) for e in job.errors)))
+        self.response.write('</table>')
+
+# Starts the import of an uploaded file
+class ImportUploadHandler(blobstore_handlers.BlobstoreUploadHandler):
+
+    def post(self):
+        """Create an ImportJob for the uploaded file."""
+        uploads = self.get_uploads('file')
+        organizer = self.request.get('organizer').strip()
+        error = None
+        if not uploads:
+            error = 'Choose a JSONL or CSV file to import.'
+        elif not organizer:
+            error = 'Enter the email of the organizer of the conferences.'
+        if error:
+            # the upload handler must answer with a redirect
+            blobstore.delete([upload.key() for upload in uploads])
+            self.redirect('/admin/import?' + urllib.urlencode(
+                {'error': error}))
+            return
+
+        batchSize = self.request.get('batchSize')
+        startImport(uploads[0].key(), uploads[0].filename, organizer,
+                    int(batchSize) if batchSize.isdigit() else None)
+        self.redirect('/admin/import')
+
+# Imports the next batches of an ImportJob
+class ImportTaskHandler(webapp2.RequestHandler):
+
+    def post(self):
+        """Carry on with an import."""
+        runImport(self.request.get('jobId'))
+
+ROUTES = [
     ('/crons/set_announcement', SetAnnouncementHandler),
+    ('/crons/send_mail', SendMailHandler),
     ('/tasks/send_confirmation_email', SendConfirmationEmailHandler),
     ('/tasks/send_session_confirmation_email',
         SendSessionConfirmationEmailHandler),
@@ -83,4 +215,22 @@ app = webapp2.WSGIApplication([
         SendSpeakerConfirmationEmailHandler),
     ('/tasks/set_featured_speaker',
         SetFeaturedSpeakerHandler),
-], debug=True)
+    ('/tasks/rebuild_speaker_counts',
+        RebuildSpeakerCountsHandler),
+    ('/tasks/rebuild_speaker_leaderboard',
+        RebuildSpeakerLeaderboardHandler),
+    ('/tasks/backfill_session_slots',
+        BackfillSessionStartSlotsHandler),
+    ('/tasks/backfill_speaker_tokens',
+        BackfillSpeakerSearchTokensHandler),
+    ('/tasks/migrate_wishlists',
+        MigrateWishlistsHandler),
+    ('/tasks/backfill_registrations',
+        BackfillRegistrationsHandler),
+    ('/admin/instrumentation', InstrumentationHandler),
+    ('/admin/import', ImportHandler),
+    ('/admin/import/upload', ImportUploadHandler),
+    ('/tasks/import', ImportTaskHandler),
+]
+
+app = InstrumentedApplication(webapp2.WSGIApplication(ROUTES, debug=True))
@@ -4,6 +4,8 @@ import endpoints
 from protorpc import messages
 from google.appengine.ext import ndb
 
+from search import indexTokens
+
 """models.py
 
 Udacity conference server-side Python App Engine data & ProtoRPC models
@@ -24,8 +26,25 @@ class Profile(ndb.Model):
     mainEmail = ndb.StringProperty()
     teeShirtSize = ndb.StringProperty(default='NOT_SPECIFIED')
     conferenceKeysToAttend = ndb.StringProperty(repeated=True)
+    # legacy wishlist, moved to WishlistEntry by /tasks/migrate_wishlists
     sessionsWishList = ndb.KeyProperty(kind="Session", repeated=True)
 
+
+class Registration(ndb.Model):
+    """Registration -- a user registered for a conference. Child of the
+    user's Profile, with the conference's websafe key as id, so it is
+    written in the same entity group as Profile.conferenceKeysToAttend."""
+    conference = ndb.KeyProperty(kind='Conference')
+    # copy of the Profile's, kept up to date by saveProfile
+    displayName = ndb.StringProperty()
+    registered = ndb.DateTimeProperty(auto_now_add=True, indexed=False)
+
+
+class WishlistEntry(ndb.Model):
+    """WishlistEntry -- a session in a user's wishlist. Child of the
+    user's Profile key, with the session's websafe key as id."""
+    added = ndb.DateTimeProperty(auto_now_add=True, indexed=False)
+
 # needed for conference registration
 
 
@@ -52,9 +71,21 @@ class ProfileForm(messages.Message):
     mainEmail = messages.StringField(3)
     teeShirtSize = messages.EnumField('TeeShirtSize', 4)
     conferenceKeysToAttend = messages.StringField(5, repeated=True)
+    # not filled any more, see getSessionsInWishlist
     sessionsWishList = messages.StringField(6, repeated=True)
 
 
+class AttendeeForm(messages.Message):
+    """AttendeeForm -- a user registered for a conference"""
+    displayName = messages.StringField(1)
+
+
+class AttendeeForms(messages.Message):
+    """AttendeeForms -- multiple AttendeeForm outbound form message"""
+    attendees = messages.MessageField(AttendeeForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+
+
 class TeeShirtSize(messages.Enum):
     """TeeShirtSize -- t-shirt size enumeration value"""
     NOT_SPECIFIED = 1
@@ -86,6 +117,24 @@ class Conference(ndb.Model):
     endDate = ndb.DateProperty()
     maxAttendees = ndb.IntegerProperty()
     seatsAvailable = ndb.IntegerProperty()
+    seatShards = ndb.IntegerProperty(default=0)
+    # bumped when the conference's sessions, featured speaker or organizer
+    # change; with the versions of its SeatShards it gives the conference's
+    # version, see ConferenceApi._conferenceVersion()
+    contentVersion = ndb.IntegerProperty(default=0, indexed=False)
+
+
+class SeatShard(ndb.Model):
+    """SeatShard -- one slice of a Conference's seat inventory.
+
+    Shards are root entities (not children of the Conference) so that
+    registrations picking different shards never contend on the same entity
+    group. The seats available for a sharded Conference is the sum of its
+    shards."""
+    conference = ndb.KeyProperty(kind='Conference')
+    seatsAvailable = ndb.IntegerProperty(default=0)
+    # bumped on every registration change on this shard
+    version = ndb.IntegerProperty(default=0, indexed=False)
 
 
 class ConferenceForm(messages.Message):
@@ -102,11 +151,15 @@ class ConferenceForm(messages.Message):
     endDate = messages.StringField(10)
     websafeKey = messages.StringField(11)
     organizerDisplayName = messages.StringField(12)
+    version = messages.IntegerField(13)
+    etag = messages.StringField(14)
+    notModified = messages.BooleanField(15)
 
 
 class ConferenceForms(messages.Message):
     """ConferenceForms -- multiple Conference outbound form message"""
     items = messages.MessageField(ConferenceForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
 
 
 class ConferenceQueryForm(messages.Message):
@@ -120,6 +173,9 @@ class ConferenceQueryForms(messages.Message):
     """ConferenceQueryForms -- multiple ConferenceQueryForm
     inbound form message"""
     filters = messages.MessageField(ConferenceQueryForm, 1, repeated=True)
+    pageSize = messages.IntegerField(2)
+    pageToken = messages.StringField(3)
+    fields = messages.StringField(4, repeated=True)
 
 
 class StringMessage(messages.Message):
@@ -127,6 +183,15 @@ class StringMessage(messages.Message):
     data = messages.StringField(1, required=True)
 
 
+class FeaturedSpeakerMessage(messages.Message):
+    """FeaturedSpeakerMessage -- outbound featured speaker message, with the
+    version of its conference if one was asked for"""
+    data = messages.StringField(1)
+    version = messages.IntegerField(2)
+    etag = messages.StringField(3)
+    notModified = messages.BooleanField(4)
+
+
 class Session(ndb.Model):
     """Session -- Session object"""
     name = ndb.StringProperty(required=True)
@@ -136,6 +201,13 @@ class Session(ndb.Model):
     typeOfSession = ndb.StringProperty()
     date = ndb.DateProperty()
     startTime = ndb.IntegerProperty()
+    # hours h (1-24) such that the session starts before h:00, so that
+    # "starts before" can be an equality filter next to an inequality; a
+    # session without startTime counts as starting before every hour, as it
+    # did when the filter ran in memory
+    startsBefore = ndb.ComputedProperty(
+        lambda self: range(self.startTime // 100 + 1, 25)
+        if self.startTime is not None else range(1, 25), repeated=True)
 
 
 class SessionForm(messages.Message):
@@ -154,6 +226,66 @@ class SessionForm(messages.Message):
 class SessionForms(messages.Message):
     """SessionForms -- multiple Session outbound form message"""
     sessions = messages.MessageField(SessionForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+    version = messages.IntegerField(3)
+    etag = messages.StringField(4)
+    notModified = messages.BooleanField(5)
+
+
+class ScheduleSessionForm(messages.Message):
+    """ScheduleSessionForm -- a session of a user's wishlist, with the
+    websafe keys of the other wishlist sessions it overlaps"""
+    session = messages.MessageField(SessionForm, 1)
+    overlapsWith = messages.StringField(2, repeated=True)
+
+
+class ScheduleForm(messages.Message):
+    """ScheduleForm -- outbound form message of a user's schedule: the
+    conferences attended, all their sessions and the wishlist"""
+    conferences = messages.MessageField(ConferenceForm, 1, repeated=True)
+    sessions = messages.MessageField(SessionForm, 2, repeated=True)
+    wishlist = messages.MessageField(ScheduleSessionForm, 3, repeated=True)
+
+
+class SessionBatchForm(messages.Message):
+    """SessionBatchForm -- inbound form message for creating many sessions
+        of one conference"""
+    websafeConferenceKey = messages.StringField(1)
+    sessions = messages.MessageField(SessionForm, 2, repeated=True)
+
+
+class SessionBatchResultForm(messages.Message):
+    """SessionBatchResultForm -- outcome of one session of a
+        SessionBatchForm: the created session or the error"""
+    index = messages.IntegerField(1)
+    session = messages.MessageField(SessionForm, 2)
+    error = messages.StringField(3)
+
+
+class SessionBatchResultForms(messages.Message):
+    """SessionBatchResultForms -- outbound form message for
+        SessionBatchForm"""
+    results = messages.MessageField(SessionBatchResultForm, 1, repeated=True)
+
+
+class ImportJob(ndb.Model):
+    """ImportJob -- progress of a bulk import of conferences, speakers and
+    sessions from an uploaded JSONL or CSV file"""
+    blobKey = ndb.BlobKeyProperty()
+    fileName = ndb.StringProperty(indexed=False)
+    format = ndb.StringProperty(choices=['jsonl', 'csv'])
+    organizerUserId = ndb.StringProperty()
+    batchSize = ndb.IntegerProperty(indexed=False)
+    csvHeader = ndb.StringProperty(repeated=True, indexed=False)
+    position = ndb.IntegerProperty(default=0, indexed=False)
+    line = ndb.IntegerProperty(default=0, indexed=False)
+    created = ndb.IntegerProperty(default=0, indexed=False)
+    skipped = ndb.IntegerProperty(default=0, indexed=False)
+    failed = ndb.IntegerProperty(default=0, indexed=False)
+    errors = ndb.TextProperty(repeated=True)
+    status = ndb.StringProperty(default='running')
+    started = ndb.DateTimeProperty(auto_now_add=True)
+    updated = ndb.DateTimeProperty(auto_now=True)
 
 
 class Speaker(ndb.Model):
@@ -161,6 +293,50 @@ class Speaker(ndb.Model):
     name = ndb.StringProperty(required=True)
     organization = ndb.StringProperty()
     interests = ndb.StringProperty(repeated=True)
+    # words of name, organization & interests and their prefixes, see
+    # search.py
+    searchTokens = ndb.ComputedProperty(
+        lambda self: indexTokens(self.name, self.organization,
+                                 *self.interests), repeated=True)
+
+
+class SpeakerSessionCount(ndb.Model):
+    """SpeakerSessionCount -- number of sessions a speaker delivers.
+
+    Root entities hold the count across all conferences; children of a
+    Conference hold the count within that conference, along with the names
+    of those sessions."""
+    speaker = ndb.KeyProperty(kind='Speaker')
+    conference = ndb.KeyProperty(kind='Conference')
+    count = ndb.IntegerProperty(default=0)
+    sessionNames = ndb.StringProperty(repeated=True, indexed=False)
+
+
+class FeaturedSpeaker(ndb.Model):
+    """FeaturedSpeaker -- featured speaker of a conference; child of the
+    Conference"""
+    speaker = ndb.KeyProperty(kind='Speaker')
+    speakerName = ndb.StringProperty(indexed=False)
+    sessionNames = ndb.StringProperty(repeated=True, indexed=False)
+
+
+class SpeakerLeaderboard(ndb.Model):
+    """SpeakerLeaderboard -- speakers with the most sessions, best first.
+
+    speakers and counts are parallel lists. floor is an upper bound on the
+    count of any speaker not on the board."""
+    speakers = ndb.KeyProperty(kind='Speaker', repeated=True, indexed=False)
+    counts = ndb.IntegerProperty(repeated=True, indexed=False)
+    floor = ndb.IntegerProperty(default=0, indexed=False)
+
+
+class NearlySoldOut(ndb.Model):
+    """NearlySoldOut -- the conferences with only a few seats left, which
+    the announcement is made of. A single entity; conferences and names
+    are parallel lists."""
+    conferences = ndb.KeyProperty(kind='Conference', repeated=True,
+                                  indexed=False)
+    names = ndb.StringProperty(repeated=True, indexed=False)
 
 
 class SpeakerForm(messages.Message):
@@ -174,6 +350,18 @@ class SpeakerForm(messages.Message):
 class SpeakerForms(messages.Message):
     """SpeakerForms -- multiple Speaker outbound form message"""
     speakers = messages.MessageField(SpeakerForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+    # set by searchSpeakers when only the first matches were ranked
+    truncated = messages.BooleanField(3)
+
+
+class SpeakerSearchForm(messages.Message):
+    """SpeakerSearchForm -- inbound form message for searching speakers by
+        words or beginnings of words of their name, organization and
+        interests"""
+    query = messages.StringField(1)
+    pageSize = messages.IntegerField(2)
+    pageToken = messages.StringField(3)
 
 
 class QueryForm(messages.Message):
@@ -186,12 +374,16 @@ class QueryForm(messages.Message):
 class QueryForms(messages.Message):
     """QueryForms -- multiple QueryForm inbound form message"""
     filters = messages.MessageField(QueryForm, 1, repeated=True)
+    pageSize = messages.IntegerField(2)
+    pageToken = messages.StringField(3)
 
 
 class ConferenceSessionQueryForm(messages.Message):
     """ConferenceSessionQueryForm -- inbound query form message for
         conference sessions"""
     websafeConferenceKey = messages.StringField(1)
+    fields = messages.StringField(2, repeated=True)
+    ifNoneMatch = messages.StringField(3)
 
 
 class ConferenceSessionTypeSessionQueryForm(messages.Message):
@@ -199,6 +391,7 @@ class ConferenceSessionTypeSessionQueryForm(messages.Message):
         conference sessions based on session type"""
     websafeConferenceKey = messages.StringField(1)
     typeOfSession = messages.StringField(2)
+    fields = messages.StringField(3, repeated=True)
 
 
 class ConferenceSessionTypeStartTimeQueryForm(messages.Message):
@@ -206,18 +399,24 @@ class ConferenceSessionTypeStartTimeQueryForm(messages.Message):
         conference sessions based on session type and start time"""
     typeOfSession = messages.StringField(1)
     startTime = messages.IntegerField(2)
+    fields = messages.StringField(3, repeated=True)
+    websafeConferenceKey = messages.StringField(4)
+    pageSize = messages.IntegerField(5)
+    pageToken = messages.StringField(6)
 
 
 class SpeakerSessionQueryForm(messages.Message):
     """SpeakerSessionQueryForm -- inbound query form message for
         conference sessions based on speaker"""
     websafeSpeakerKey = messages.StringField(1)
+    fields = messages.StringField(2, repeated=True)
 
 
 class SessionStartTimeQueryForm(messages.Message):
     """SessionStartTimeQueryForm -- inbound query form message for
         conference sessions based on start time"""
     startTime = messages.IntegerField(1)
+    fields = messages.StringField(2, repeated=True)
 
 # For Task 3
 
@@ -225,9 +424,11 @@ class SessionStartTimeQueryForm(messages.Message):
 class SessionStartTimeDurationQueryForm(messages.Message):
     startTime = messages.IntegerField(1)
     duration = messages.IntegerField(2)
+    fields = messages.StringField(3, repeated=True)
 
 
 class SessionMinStartTimeDurationHighlightsQueryForm(messages.Message):
     startTime = messages.IntegerField(1)
     duration = messages.IntegerField(2)
     highlights = messages.StringField(3)
+    fields = messages.StringField(4, repeated=True)
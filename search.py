@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+search.py -- tokens of the speaker search index and ranking of the
+    speakers found.
+
+Every word of a speaker's name, organization and interests is lowercased,
+stripped of accents and stored in Speaker.searchTokens together with its
+prefixes, so that a search for "mach lear" is two equality filters on that
+property. Words are stored up to MAX_PREFIX_LENGTH characters; longer search
+terms are looked up by their first MAX_PREFIX_LENGTH characters and checked
+in memory.
+
+$Id: search.py
+
+Author: Zeeshan Ahmad
+Email: ahmad.zeeshaan@gmail.com
+
+"""
+
+import re
+import unicodedata
+
+__author__ = 'ahmad.zeeshan@gmail.com (Zeeshan Ahmad)'
+
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_LENGTH = 15
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """Split text into lowercase words without accents."""
+    if not text:
+        return []
+    if isinstance(text, str):
+        text = text.decode('utf-8')
+    text = unicodedata.normalize('NFKD', text)
+    text = u''.join(c for c in text if not unicodedata.combining(c))
+    return _WORD.findall(text.lower())
+
+
+def indexTerm(word):
+    """The token a word, or a search term, is looked up by."""
+    return word[:MAX_PREFIX_LENGTH]
+
+
+def indexTokens(*texts):
+    """All the tokens and prefixes stored for the given texts."""
+    tokens = set()
+    for text in texts:
+        for word in tokenize(text):
+            tokens.add(indexTerm(word))
+            for length in range(MIN_PREFIX_LENGTH,
+                                min(len(word), MAX_PREFIX_LENGTH)):
+                tokens.add(word[:length])
+    return sorted(tokens)
+
+
+def score(terms, weighted_texts):
+    """Rank a result for the search terms; 0 if a term isn't matched.
+
+    weighted_texts is a list of (weight, text). A term scores the weight
+    of the best text one of whose words starts with it, twice that if the
+    word is the term itself, and the scores of all the terms are added up.
+    """
+    weighted_words = [(weight, tokenize(text))
+                      for weight, text in weighted_texts]
+    total = 0
+    for term in terms:
+        best = 0
+        for weight, words in weighted_words:
+            for word in words:
+                if word == term:
+                    best = max(best, 2 * weight)
+                elif word.startswith(term):
+                    best = max(best, weight)
+        if not best:
+            return 0
+        total += best
+    return total
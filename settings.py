@@ -13,3 +13,13 @@ created/forked from conference.py by wesc on 2014 may 24
 # Replace the following lines with client IDs obtained from the APIs
 # Console or Cloud Console.
 WEB_CLIENT_ID = '856270118250-ie667n7a2gtnjb2bnu1ms0j1c3u5h6e6.apps.googleusercontent.com'  #noqa
+
+# Log one structured line (JSON) per request with its datastore, memcache and
+# task queue usage, see instrumentation.py
+INSTRUMENTATION_LOG_REQUESTS = False
+
+# How confirmation emails are sent, see mailer.py: 'appengine' for the mail
+# API, or 'smtp' for the SMTP server below (e.g. a local stand-in in tests)
+MAIL_TRANSPORT = 'appengine'
+MAIL_SMTP_HOST = 'localhost'
+MAIL_SMTP_PORT = 1025
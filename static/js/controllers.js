@@ -293,6 +293,12 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
      */
     $scope.conferences = [];
 
+    /**
+     * Holds the token of the next server side page of conferences, if any.
+     * @type {string}
+     */
+    $scope.nextPageToken = null;
+
     /**
      * Holds the state if offcanvas is enabled.
      *
@@ -414,6 +420,7 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
      */
     $scope.queryConferences = function () {
         $scope.submitted = false;
+        $scope.nextPageToken = null;
         if ($scope.selectedTab == 'ALL') {
             $scope.queryConferencesAll();
         } else if ($scope.selectedTab == 'YOU_HAVE_CREATED') {
@@ -425,10 +432,16 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
 
     /**
      * Invokes the conference.queryConferences API.
+     *
+     * @param loadMore if true, fetches the page after the current one and appends it to $scope.conferences.
      */
-    $scope.queryConferencesAll = function () {
+    $scope.queryConferencesAll = function (loadMore) {
         var sendFilters = {
-            filters: []
+            filters: [],
+            pageSize: $scope.pagination.pageSize
+        }
+        if (loadMore && $scope.nextPageToken) {
+            sendFilters.pageToken = $scope.nextPageToken;
         }
         for (var i = 0; i < $scope.filters.length; i++) {
             var filter = $scope.filters[i];
@@ -458,10 +471,14 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
                         $scope.alertStatus = 'success';
                         $log.info($scope.messages);
 
-                        $scope.conferences = [];
+                        if (!loadMore) {
+                            $scope.conferences = [];
+                            $scope.pagination.currentPage = 0;
+                        }
                         angular.forEach(resp.items, function (conference) {
                             $scope.conferences.push(conference);
                         });
+                        $scope.nextPageToken = resp.nextPageToken || null;
                     }
                     $scope.submitted = true;
                 });
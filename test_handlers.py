@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+"""
+test_handlers.py -- runs the task handlers of main.py, and the OAuth path
+    of utils.getUserId with a stand-in tokeninfo fetcher, against local App
+    Engine service stubs from the SDK's testbed.
+
+Usage:
+    python test_handlers.py \\
+        --sdk ~/google-cloud-sdk/platform/google_appengine
+
+Author: Zeeshan Ahmad
+Email: ahmad.zeeshaan@gmail.com
+
+"""
+
+import argparse
+import os
+import sys
+import unittest
+
+from benchmark import APP_ROOT
+from benchmark import setup_sdk
+
+__author__ = 'ahmad.zeeshan@gmail.com (Zeeshan Ahmad)'
+
+
+class HandlerTest(unittest.TestCase):
+    """Seeds the stubs through ConferenceApi and posts to the handlers."""
+
+    def setUp(self):
+        from google.appengine.datastore import datastore_stub_util
+        from google.appengine.ext import ndb
+        from google.appengine.ext import testbed
+
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.setup_env(app_id='conference-test', overwrite=True)
+        policy = datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+            probability=1)
+        self.testbed.init_datastore_v3_stub(consistency_policy=policy)
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub(root_path=APP_ROOT)
+        self.testbed.init_app_identity_stub()
+        self.testbed.init_mail_stub()
+        self.testbed.init_user_stub()
+        ndb.get_context().clear_cache()
+
+        os.environ['ENDPOINTS_AUTH_EMAIL'] = 'organizer@example.com'
+        os.environ['ENDPOINTS_AUTH_DOMAIN'] = 'gmail.com'
+
+        from conference import ConferenceApi
+        self.api = ConferenceApi()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def post(self, path, params):
+        """POST params to a handler of main.py; returns the response."""
+        import webapp2
+        from main import app
+        return webapp2.Request.blank(path, POST=params).get_response(app)
+
+    def createSessions(self, count):
+        """A conference and a speaker with count sessions; returns the
+        websafe keys of the conference and the speaker."""
+        from models import ConferenceForm
+        from models import SessionForm
+        from models import SpeakerForm
+
+        conf = self.api._createConferenceObject(ConferenceForm(
+            name='PyCon', city='London', maxAttendees=100,
+            startDate='2016-05-01', endDate='2016-05-03'))
+        speaker = self.api._createSpeakerObject(SpeakerForm(name='Ada'))
+        for i in range(count):
+            self.api._createSessionObject(SessionForm(
+                name='Session %d' % i, duration=60, typeOfSession='Lecture',
+                date='2016-05-01', startTime=900 + i * 100,
+                websafeConferenceKey=conf.websafeKey,
+                websafeSpeakerKey=speaker.websafeSpeakerKey))
+        return conf.websafeKey, speaker.websafeSpeakerKey
+
+    def testSetFeaturedSpeaker(self):
+        from google.appengine.api import memcache
+        from google.appengine.ext import ndb
+        from conference import MEMCACHE_CONFERENCE_FEATURED_SPEAKER_KEY
+        from conference import MEMCACHE_FEATURED_SPEAKER_KEY
+        from models import FeaturedSpeaker
+
+        wsck, wssk = self.createSessions(2)
+        conf_key = ndb.Key(urlsafe=wsck)
+        version = conf_key.get().contentVersion
+
+        response = self.post('/tasks/set_featured_speaker', {
+            'websafeConferenceKey': wsck,
+            'websafeSpeakerKey': wssk,
+            'speaker': 'Ada'})
+
+        self.assertEqual(response.status_int, 200)
+        featured = ndb.Key(FeaturedSpeaker, 'featured', parent=conf_key).get()
+        self.assertEqual(featured.speakerName, 'Ada')
+        self.assertEqual(sorted(featured.sessionNames),
+                         ['Session 0', 'Session 1'])
+        self.assertEqual(conf_key.get().contentVersion, version + 1)
+        self.assertIn('Ada is featured speaker',
+                      memcache.get(MEMCACHE_FEATURED_SPEAKER_KEY))
+
+        # the conference's message was dropped, and can't be cached again
+        # during the lock, but is read from the stored FeaturedSpeaker
+        cache_key = MEMCACHE_CONFERENCE_FEATURED_SPEAKER_KEY % wsck
+        self.assertIsNone(memcache.get(cache_key))
+        self.assertIn('Ada is featured speaker',
+                      self.api._getFeaturedSpeaker(wsck))
+        self.assertIsNone(memcache.get(cache_key))
+
+    def testNoFeaturedSpeakerForOneSession(self):
+        from google.appengine.ext import ndb
+        from models import FeaturedSpeaker
+
+        wsck, wssk = self.createSessions(1)
+
+        response = self.post('/tasks/set_featured_speaker', {
+            'websafeConferenceKey': wsck,
+            'websafeSpeakerKey': wssk,
+            'speaker': 'Ada'})
+
+        self.assertEqual(response.status_int, 200)
+        self.assertIsNone(ndb.Key(FeaturedSpeaker, 'featured',
+                                  parent=ndb.Key(urlsafe=wsck)).get())
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+
+class FakeRpc(object):
+    """Stand-in urlfetch RPC: returns a response or raises an error."""
+
+    def __init__(self, result):
+        self.result = result
+
+    def get_result(self):
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+class FakeFetcher(object):
+    """Tokeninfo fetcher answering from a list of results, one per call,
+    and recording the URLs asked for."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.urls = []
+
+    def __call__(self, url):
+        self.urls.append(url)
+        return FakeRpc(self.results.pop(0))
+
+
+class GetUserIdTest(unittest.TestCase):
+    """getUserId(id_type='oauth') with a stand-in fetcher."""
+
+    def setUp(self):
+        from google.appengine.ext import testbed
+        import utils
+
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_memcache_stub()
+        utils._token_cache.clear()
+        os.environ['HTTP_AUTHORIZATION'] = 'Bearer token-1'
+        os.environ.pop('OAUTH_USER_ID', None)
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def getUserId(self, fetcher, **options):
+        from utils import getUserId
+        return getUserId(None, id_type='oauth', fetcher=fetcher, **options)
+
+    def testLooksUpIdTokenOnceAndCaches(self):
+        fetcher = FakeFetcher(FakeResponse(
+            200, '{"user_id": "42", "expires_in": 3600}'))
+
+        self.assertEqual(self.getUserId(fetcher), '42')
+        self.assertEqual(self.getUserId(fetcher), '42')
+        self.assertEqual(len(fetcher.urls), 1)
+        self.assertIn('id_token=token-1', fetcher.urls[0])
+
+    def testFallsBackToAccessToken(self):
+        fetcher = FakeFetcher(
+            FakeResponse(400, '{"error": "invalid_token"}'),
+            FakeResponse(200, '{"user_id": "42", "expires_in": 3600}'))
+
+        self.assertEqual(self.getUserId(fetcher), '42')
+        self.assertIn('access_token=token-1', fetcher.urls[1])
+
+    def testParallelLooksUpBothTypesAtOnce(self):
+        fetcher = FakeFetcher(
+            FakeResponse(400, '{"error": "invalid_token"}'),
+            FakeResponse(200, '{"user_id": "42", "expires_in": 3600}'))
+
+        self.assertEqual(self.getUserId(fetcher, parallel=True), '42')
+        self.assertEqual(len(fetcher.urls), 2)
+
+    def testRetriesOnceThenGivesUpWithoutCaching(self):
+        from google.appengine.api import urlfetch
+
+        fetcher = FakeFetcher(urlfetch.DownloadError(),
+                              urlfetch.DownloadError())
+        self.assertEqual(self.getUserId(fetcher), '')
+        self.assertEqual(len(fetcher.urls), 2)
+
+        fetcher = FakeFetcher(FakeResponse(
+            200, '{"user_id": "42", "expires_in": 3600}'))
+        self.assertEqual(self.getUserId(fetcher), '42')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sdk', help='path to the App Engine SDK '
+                        '(the directory containing dev_appserver.py)')
+    options, rest = parser.parse_known_args()
+    setup_sdk(options.sdk)
+    unittest.main(argv=sys.argv[:1] + rest)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,38 +1,135 @@
+from collections import OrderedDict
+import hashlib
 import json
+import logging
 import os
+import threading
 import time
 import uuid
 
+from google.appengine.api import memcache
 from google.appengine.api import urlfetch
 from models import Profile
 
-def getUserId(user, id_type="email"):
+TOKENINFO_URL = 'https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
+TOKENINFO_DEADLINE = 5
+# a failed lookup is retried at once with a new RPC, never after a sleep;
+# if that fails too the user id is '' and the next request tries again
+TOKENINFO_ATTEMPTS = 2
+
+# token -> user_id, kept until the token expires; TOKEN_CACHE_SIZE tokens
+# per instance, the rest in memcache
+MEMCACHE_TOKEN_KEY = 'TOKENINFO:%s'
+TOKEN_CACHE_SIZE = 1000
+
+_token_cache = OrderedDict()
+_token_cache_lock = threading.Lock()
+
+
+def fetchTokenInfo(url):
+    """Start fetching url; returns an RPC whose get_result() gives the
+    response."""
+    rpc = urlfetch.create_rpc(deadline=TOKENINFO_DEADLINE)
+    urlfetch.make_fetch_call(rpc, url)
+    return rpc
+
+
+def _tokenKey(token):
+    """Cache key of a token; tokens are secret and can be longer than a
+    memcache key, so only their hash is kept."""
+    return hashlib.sha256(token).hexdigest()
+
+
+def _cachedUserId(key):
+    """user_id of the token hashed to key if it hasn't expired, or None."""
+    now = time.time()
+    with _token_cache_lock:
+        cached = _token_cache.pop(key, None)
+        if cached and cached[1] > now:
+            _token_cache[key] = cached
+            return cached[0]
+    cached = memcache.get(MEMCACHE_TOKEN_KEY % key)
+    if cached and cached[1] > now:
+        _cacheUserId(key, cached[0], cached[1], shared=False)
+        return cached[0]
+    return None
+
+
+def _cacheUserId(key, user_id, expires, shared=True):
+    """Keep user_id for the token hashed to key until expires."""
+    with _token_cache_lock:
+        _token_cache.pop(key, None)
+        _token_cache[key] = (user_id, expires)
+        while len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    if shared:
+        memcache.set(MEMCACHE_TOKEN_KEY % key, (user_id, expires),
+                     time=int(expires - time.time()) or 1)
+
+
+def _tokenInfo(token, fetcher, parallel=False):
+    """Look token up and return its tokeninfo, {} if it isn't valid.
+
+    The token is looked up as an access token if endpoints found it to be
+    one, otherwise as an id token and then, if that says it's invalid, as
+    an access token; with parallel, as both at once. Lookups that fail are
+    retried right away with new RPCs, TOKENINFO_ATTEMPTS times at most; the
+    request thread never sleeps."""
+    if 'OAUTH_USER_ID' in os.environ:
+        token_types = ['access_token']
+    elif parallel:
+        token_types = ['id_token', 'access_token']
+    else:
+        token_types = ['id_token']
+    failures = 0
+    while token_types and failures < TOKENINFO_ATTEMPTS:
+        rpcs = [(token_type, fetcher(TOKENINFO_URL % (token_type, token)))
+                for token_type in token_types]
+        token_types = []
+        failed = False
+        for token_type, rpc in rpcs:
+            try:
+                resp = rpc.get_result()
+            except urlfetch.Error:
+                logging.warning('tokeninfo lookup failed', exc_info=True)
+                resp = None
+            if resp and resp.status_code == 200:
+                return json.loads(resp.content)
+            if resp and resp.status_code == 400:
+                # an invalid token won't become valid, but an invalid id
+                # token may be an access token
+                if token_type == 'id_token' and len(rpcs) == 1 and \
+                        'invalid_token' in resp.content:
+                    token_types.append('access_token')
+            else:
+                failed = True
+                token_types.append(token_type)
+        if failed:
+            failures += 1
+    return {}
+
+
+def getUserId(user, id_type="email", fetcher=None, parallel=False):
     if id_type == "email":
         return user.email()
 
     if id_type == "oauth":
         """A workaround implementation for getting userid."""
+        # tokens are looked up with fetcher (fetchTokenInfo if None, pass a
+        # stand-in in tests), as id and access token at once with parallel,
+        # and their user_id is cached until they expire
         auth = os.getenv('HTTP_AUTHORIZATION')
         bearer, token = auth.split()
-        token_type = 'id_token'
-        if 'OAUTH_USER_ID' in os.environ:
-            token_type = 'access_token'
-        url = ('https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
-               % (token_type, token))
-        user = {}
-        wait = 1
-        for i in range(3):
-            resp = urlfetch.fetch(url)
-            if resp.status_code == 200:
-                user = json.loads(resp.content)
-                break
-            elif resp.status_code == 400 and 'invalid_token' in resp.content:
-                url = ('https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
-                       % ('access_token', token))
-            else:
-                time.sleep(wait)
-                wait = wait + i
-        return user.get('user_id', '')
+        key = _tokenKey(token)
+        user_id = _cachedUserId(key)
+        if user_id is not None:
+            return user_id
+        info = _tokenInfo(token, fetcher or fetchTokenInfo, parallel)
+        user_id = info.get('user_id', '')
+        expires_in = int(info.get('expires_in', 0))
+        if user_id and expires_in > 0:
+            _cacheUserId(key, user_id, time.time() + expires_in)
+        return user_id
 
     if id_type == "custom":
         # implement your own user_id creation and getting algorythm